@@ -144,6 +144,44 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media/')
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
+# Filter results, facet counts and anonymous pages are cached under a version
+# that writes bump. Every worker must see the same version, so these caches are
+# only used with a backend the workers share: REDIS_URL for Redis (needs the
+# redis package), or CACHE_TABLE for the database cache (create the table with
+# `manage.py createcachetable`). Otherwise each process would keep its own
+# version and serve stale results after another worker's writes.
+if os.environ.get('REDIS_URL'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': os.environ['REDIS_URL']}}
+elif os.environ.get('CACHE_TABLE'):
+    CACHES = {'default': {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': os.environ['CACHE_TABLE']}}
+SHARED_CACHE = bool(os.environ.get('REDIS_URL') or os.environ.get('CACHE_TABLE'))
+
+# List pages page with opaque (created_at, id) / (calories, id) cursors instead
+# of ?page=N when enabled; a request carrying a cursor always uses them.
+CURSOR_PAGINATION = os.environ.get('CURSOR_PAGINATION', '') == 'True'
+
+# Worker processes rendering recipe image variants; 0 renders them inline after commit.
+IMAGE_VARIANT_WORKERS = int(os.environ.get('IMAGE_VARIANT_WORKERS', 2))
+
+# Sizes /media/r/<width>x<height>/<image> will render; anything else is a 404,
+# so the endpoint cannot be made to resize to arbitrary dimensions.
+IMAGE_RESIZE_SIZES = {'160x160', '320x240', '480x360', '640x480', '960x720', '1600x1200'}
+IMAGE_RESIZE_CACHE_DIR = os.path.join(BASE_DIR, 'cache', 'resized')
+IMAGE_RESIZE_CACHE_BYTES = int(os.environ.get('IMAGE_RESIZE_CACHE_BYTES', 512 * 1024 * 1024))
+
+# How media responses hand the bytes to the front server: 'nginx' sends
+# X-Accel-Redirect to the internal location mapped to the file's directory,
+# 'sendfile' sends X-Sendfile (Apache mod_xsendfile, lighttpd), and '' streams
+# from Django. Each location needs an nginx `internal` alias to its directory.
+MEDIA_SENDFILE = os.environ.get('MEDIA_SENDFILE', '')
+# Called as check(request, recipe_image) before a media file is served. The
+# default lets anyone see recipe images, which the public list already shows.
+MEDIA_ACCESS_CHECK = 'recipeApp.views.can_view_media'
+MEDIA_SENDFILE_LOCATIONS = {
+    MEDIA_ROOT: '/internal/media/',
+    IMAGE_RESIZE_CACHE_DIR: '/internal/resized/',
+}
+
 LOGOUT_REDIRECT_URL = 'home'
 LOGIN_REDIRECT_URL = 'home'
 LOGOUT_URL = 'logout'
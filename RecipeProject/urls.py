@@ -18,13 +18,11 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
-from django.conf.urls.static import static
+from recipeApp.views import serve_media
 
 urlpatterns = [
     path('', include('recipeApp.urls')),
     path('account/', include('account.urls')),
     path("admin/", admin.site.urls),
-]
-
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+    path(settings.MEDIA_URL.lstrip('/') + '<path:name>', serve_media, name='media'),
+]
\ No newline at end of file
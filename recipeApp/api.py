@@ -0,0 +1,243 @@
+"""
+Read-only JSON views of recipes and collections. Rows are read with
+``.values()`` and never turned into model instances: ``?fields=`` narrows the
+columns selected, ``?include=`` adds related rows with one query per relation
+for the whole page, and lists page with the keyset paginator. Lists report the
+order they are in as ``ordering``; relevance-ranked searches fall back to
+newest first, and a sort the paginator cannot seek through is a 400.
+"""
+from collections import defaultdict
+from functools import wraps
+
+import django_filters
+from django import forms
+from django.http import JsonResponse
+from django.views.decorators.http import require_GET
+
+from .filters import RecipeCollectionFilter, RecipeFilter
+from .models import Recipe, RecipeCollection, RecipeImage, RecipeIngredient
+from .pagination import KeysetPaginator
+from .storage import recipe_image_storage
+
+
+API_PAGE_SIZE = 20
+API_MAX_PAGE_SIZE = 100
+
+# API field name: the lookup ``.values()`` reads it from.
+RECIPE_FIELDS = {
+    'id': 'pk',
+    'title': 'title',
+    'author': 'author__username',
+    'servings': 'servings',
+    'prepration_time': 'prepration_time',
+    'total_time': 'total_time',
+    'calories': 'calories',
+    'instructions': 'instructions',
+    'featured': 'featured',
+    'cuisine': 'cuisine',
+    'food_type': 'food_type',
+    'difficulty': 'difficulty',
+    'num_ingredients': 'num_ingredients',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+COLLECTION_FIELDS = {
+    'id': 'pk',
+    'title': 'title',
+    'user': 'user__username',
+    'num_recipes': 'num_recipes',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+
+
+class ApiError(Exception):
+    pass
+
+
+def api_view(view):
+    """GET only, with ``ApiError`` answered as a 400."""
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        try:
+            return view(request, *args, **kwargs)
+        except ApiError as error:
+            return JsonResponse({'error': str(error)}, status=400)
+    return require_GET(wrapped)
+
+
+def _authentication_required():
+    return JsonResponse({'error': 'Authentication required.'}, status=401)
+
+
+def api_login_required(view):
+    """Like the HTML detail pages, but a 401 instead of a redirect to the login form."""
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        if not request.user.is_authenticated:
+            return _authentication_required()
+        return view(request, *args, **kwargs)
+    return wrapped
+
+
+def api_user_filter_login_required(view):
+    """The same 401 for a list asked for the viewer's own rows (``?user_filter=``) without a viewer."""
+    @wraps(view)
+    def wrapped(request, *args, **kwargs):
+        own_rows = forms.NullBooleanField().to_python(request.GET.get('user_filter'))
+        if own_rows and not request.user.is_authenticated:
+            return _authentication_required()
+        return view(request, *args, **kwargs)
+    return wrapped
+
+
+def _names(request, param, allowed, default):
+    value = request.GET.get(param)
+    if not value:
+        return list(default)
+    names = [name.strip() for name in value.split(',') if name.strip()]
+    unknown = sorted(set(names) - set(allowed))
+    if unknown:
+        raise ApiError(f"Unknown {param}: {', '.join(unknown)}. Choose from {', '.join(allowed)}.")
+    return names
+
+
+def _page_size(request):
+    try:
+        size = int(request.GET.get('limit', API_PAGE_SIZE))
+    except ValueError:
+        raise ApiError("limit must be a number.")
+    return max(1, min(size, API_MAX_PAGE_SIZE))
+
+
+def _project(queryset, fields, lookups, extra=()):
+    """``.values()`` of the requested fields plus whatever paging and includes need."""
+    return queryset.values(*{lookups[name] for name in fields} | {'pk', *extra})
+
+
+def _shape(rows, fields, lookups):
+    return [{name: row[lookups[name]] for name in fields} for row in rows]
+
+
+def _ingredients(recipe_ids):
+    grouped = defaultdict(list)
+    rows = RecipeIngredient.objects.filter(recipe_id__in=recipe_ids).order_by('pk').values(
+        'recipe_id', 'name', 'quantity', 'unit', 'optional'
+    )
+    for row in rows:
+        grouped[row.pop('recipe_id')].append(row)
+    return grouped
+
+
+def _images(recipe_ids):
+    storage = recipe_image_storage()
+    grouped = defaultdict(list)
+    rows = RecipeImage.objects.filter(recipe_id__in=recipe_ids).order_by('pk').values(
+        'recipe_id', 'image', 'description', 'variants'
+    )
+    for row in rows:
+        grouped[row['recipe_id']].append({
+            'url': storage.url(row['image']),
+            'description': row['description'],
+            'variants': {
+                name: {
+                    'width': rendition['width'],
+                    'height': rendition['height'],
+                    'urls': {fmt: storage.url(path) for fmt, path in rendition['formats'].items()},
+                }
+                for name, rendition in row['variants'].items()
+            },
+        })
+    return grouped
+
+
+def _collection_recipes(collection_ids):
+    grouped = defaultdict(list)
+    rows = RecipeCollection.recipes.through.objects.filter(recipecollection_id__in=collection_ids).order_by(
+        'recipe_id'
+    ).values_list('recipecollection_id', 'recipe_id')
+    for collection_id, recipe_id in rows:
+        grouped[collection_id].append(recipe_id)
+    return grouped
+
+
+RECIPE_INCLUDES = {'ingredients': _ingredients, 'images': _images}
+COLLECTION_INCLUDES = {'recipes': _collection_recipes}
+
+
+def _attach(request, rows, shaped, includes):
+    ids = [row['pk'] for row in rows]
+    for name in _names(request, 'include', includes, ()):
+        related = includes[name](ids) if ids else {}
+        for row, item in zip(rows, shaped):
+            item[name] = related.get(row['pk'], [])
+    return shaped
+
+
+def _ordering(request, filterset):
+    """The single field the list is ordered by, as ``-field`` or ``field``."""
+    sorts = [
+        name for name, declared in filterset.filters.items()
+        if isinstance(declared, django_filters.OrderingFilter) and request.GET.get(name)
+    ]
+    queryset = filterset.qs
+    if KeysetPaginator.supports(queryset):
+        # Several sort parameters still leave one ordering: the last filter applied replaces the rest.
+        if len(sorts) > 1:
+            raise ApiError(f"Only one sort can be paged; got {', '.join(sorts)}.")
+        return queryset, queryset.query.order_by[0]
+    if sorts:
+        raise ApiError(f"Sorting by {', '.join(request.GET[name] for name in sorts)} cannot be paged.")
+    # Relevance-ranked search results have no stable key to seek past.
+    return queryset.order_by('-created_at'), '-created_at'
+
+
+def _list(request, filterset, lookups, includes):
+    fields = _names(request, 'fields', lookups, lookups)
+    # Reject unknown includes and sorts before running the page query.
+    _names(request, 'include', includes, ())
+    queryset, ordering = _ordering(request, filterset)
+    page = KeysetPaginator(
+        _project(queryset, fields, lookups, [ordering.lstrip('-')]), _page_size(request)
+    ).get_page(request.GET.get('cursor'))
+    rows = list(page)
+    shaped = _attach(request, rows, _shape(rows, fields, lookups), includes)
+    return JsonResponse({
+        'results': shaped, 'ordering': ordering, 'next': page.next_cursor, 'previous': page.previous_cursor,
+    })
+
+
+def _detail(request, queryset, pk, lookups, includes):
+    fields = _names(request, 'fields', lookups, lookups)
+    rows = list(_project(queryset.filter(pk=pk), fields, lookups))
+    if not rows:
+        return JsonResponse({'error': 'Not found.'}, status=404)
+    return JsonResponse(_attach(request, rows, _shape(rows, fields, lookups), includes)[0])
+
+
+@api_view
+@api_user_filter_login_required
+def recipe_list(request):
+    filterset = RecipeFilter(request.GET, queryset=Recipe.objects.order_by('-created_at'), user=request.user)
+    return _list(request, filterset, RECIPE_FIELDS, RECIPE_INCLUDES)
+
+
+@api_view
+@api_login_required
+def recipe_detail(request, pk):
+    return _detail(request, Recipe.objects.all(), pk, RECIPE_FIELDS, RECIPE_INCLUDES)
+
+
+@api_view
+@api_user_filter_login_required
+def collection_list(request):
+    filterset = RecipeCollectionFilter(
+        request.GET, queryset=RecipeCollection.objects.order_by('-created_at'), user=request.user
+    )
+    return _list(request, filterset, COLLECTION_FIELDS, COLLECTION_INCLUDES)
+
+
+@api_view
+@api_login_required
+def collection_detail(request, pk):
+    return _detail(request, RecipeCollection.objects.all(), pk, COLLECTION_FIELDS, COLLECTION_INCLUDES)
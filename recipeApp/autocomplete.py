@@ -0,0 +1,152 @@
+import bisect
+import heapq
+import threading
+import time
+
+from django.conf import settings
+from django.db.models import Count
+
+from .models import RecipeIngredient
+
+
+MAX_SUGGESTIONS = 20
+
+
+def normalize(name):
+    return ' '.join(name.lower().split())
+
+
+class PrefixIndex:
+    """
+    Distinct names kept in a sorted array with a usage weight each.
+
+    A prefix maps to a contiguous slice of the array found with two bisections;
+    the heaviest names in that slice are the suggestions. Slices too wide to
+    rank on every keystroke keep their top ``MAX_SUGGESTIONS`` memoised. Short
+    prefixes are ranked up front and writes patch the memo in place, so the
+    read path never has to rank a wide slice.
+    """
+
+    cache_threshold = 64
+    warm_prefix_length = 2
+
+    def __init__(self, counts=()):
+        self._lock = threading.Lock()
+        self._counts = {}
+        for name, count in dict(counts).items():
+            name = normalize(name)
+            if name and count > 0:
+                self._counts[name] = self._counts.get(name, 0) + count
+        self._names = sorted(self._counts)
+        self._top = {}
+        self._warm()
+
+    def __len__(self):
+        return len(self._names)
+
+    def add(self, name, count=1):
+        name = normalize(name)
+        if not name:
+            return
+        with self._lock:
+            if name not in self._counts:
+                bisect.insort(self._names, name)
+                self._counts[name] = 0
+            self._counts[name] += count
+            self._reweigh(name, increased=True)
+
+    def remove(self, name, count=1):
+        name = normalize(name)
+        with self._lock:
+            if name not in self._counts:
+                return
+            self._counts[name] -= count
+            if self._counts[name] <= 0:
+                del self._counts[name]
+                del self._names[bisect.bisect_left(self._names, name)]
+            self._reweigh(name, increased=False)
+
+    def suggest(self, prefix, limit=10):
+        """Return up to ``limit`` ``(name, uses)`` pairs starting with ``prefix``, most used first."""
+        prefix = normalize(prefix)
+        limit = max(0, min(limit, MAX_SUGGESTIONS))
+        if not prefix or not limit:
+            return []
+        with self._lock:
+            top = self._top.get(prefix)
+            if top is None:
+                top = self._rank(prefix)
+            return [(name, self._counts[name]) for name in top[:limit]]
+
+    def _weight(self, name):
+        return (self._counts.get(name, 0), -len(name))
+
+    def _rank(self, prefix):
+        start = bisect.bisect_left(self._names, prefix)
+        end = bisect.bisect_left(self._names, prefix + '\U0010ffff', start)
+        top = heapq.nlargest(MAX_SUGGESTIONS, self._names[start:end], key=self._weight)
+        if end - start > self.cache_threshold:
+            self._top[prefix] = top
+        return top
+
+    def _warm(self):
+        prefixes = {name[:i] for name in self._names for i in range(1, self.warm_prefix_length + 1)}
+        for prefix in prefixes:
+            self._rank(prefix)
+
+    def _reweigh(self, name, increased):
+        for i in range(1, len(name) + 1):
+            prefix = name[:i]
+            top = self._top.get(prefix)
+            if top is None:
+                continue
+            if name in top:
+                if increased:
+                    top.sort(key=self._weight, reverse=True)
+                else:
+                    # Something outside the memo may now outrank it; re-rank on the write path.
+                    del self._top[prefix]
+                    self._rank(prefix)
+            elif increased and self._weight(name) > self._weight(top[-1]):
+                top.append(name)
+                top.sort(key=self._weight, reverse=True)
+                del top[MAX_SUGGESTIONS:]
+
+
+def load_ingredient_counts():
+    counts = {}
+    for row in RecipeIngredient.objects.values('name').annotate(uses=Count('pk')).iterator():
+        name = normalize(row['name'])
+        counts[name] = counts.get(name, 0) + row['uses']
+    return counts
+
+
+_index = None
+_built_at = 0.0
+_build_lock = threading.Lock()
+
+
+def get_ingredient_index():
+    """
+    The per-process ingredient index, built on first use. Signals keep it current
+    for writes made by this process; ``AUTOCOMPLETE_INDEX_TTL`` bounds how long
+    writes made by other processes can go unseen.
+    """
+    global _index, _built_at
+    ttl = getattr(settings, 'AUTOCOMPLETE_INDEX_TTL', 900)
+    if _index is None or time.monotonic() - _built_at > ttl:
+        with _build_lock:
+            if _index is None or time.monotonic() - _built_at > ttl:
+                _index = PrefixIndex(load_ingredient_counts())
+                _built_at = time.monotonic()
+    return _index
+
+
+def loaded_ingredient_index():
+    """The index if this process has built it, else ``None``; no point updating an unbuilt one."""
+    return _index
+
+
+def reset_ingredient_index():
+    global _index
+    _index = None
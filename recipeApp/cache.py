@@ -0,0 +1,70 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+
+
+CATALOGUE_VERSION_KEY = 'recipeApp:catalogue-version'
+PAGE_VERSION_KEY = 'recipeApp:page-version'
+
+
+def shared_cache_enabled():
+    """
+    Whether results may be cached at all. Invalidation bumps a version kept in
+    the cache, which only reaches every worker when they share it (``SHARED_CACHE``).
+    """
+    return getattr(settings, 'SHARED_CACHE', False)
+
+
+def _version(version_key):
+    version = cache.get(version_key)
+    if version is None:
+        # Seed from the clock so an evicted counter never restarts at a value
+        # whose entries could still be cached.
+        cache.add(version_key, time.time_ns(), timeout=None)
+        version = cache.get(version_key)
+    return version
+
+
+def _bump(version_key):
+    try:
+        cache.incr(version_key)
+    except ValueError:
+        _version(version_key)
+
+
+def _key(namespace, version, params):
+    digest = hashlib.md5(json.dumps(params, sort_keys=True, default=str).encode()).hexdigest()
+    return f'recipeApp:{namespace}:{version}:{digest}'
+
+
+def catalogue_version():
+    """
+    A number that changes whenever the recipe catalogue is written. Keys built
+    from it go stale all at once when it is bumped, so nothing has to be deleted.
+    """
+    return _version(CATALOGUE_VERSION_KEY)
+
+
+def bump_catalogue_version():
+    _bump(CATALOGUE_VERSION_KEY)
+
+
+def catalogue_key(namespace, params):
+    """Cache key for ``params`` (any JSON-serialisable value) under the current catalogue version."""
+    return _key(namespace, catalogue_version(), params)
+
+
+def page_version():
+    """Like ``catalogue_version``, for whole rendered pages, which also show images and collections."""
+    return _version(PAGE_VERSION_KEY)
+
+
+def bump_page_version():
+    _bump(PAGE_VERSION_KEY)
+
+
+def page_key(path, params):
+    return _key('page', page_version(), [path, params])
@@ -0,0 +1,63 @@
+import hashlib
+
+from django.db.models import Max
+from django.middleware.csrf import get_token
+from django.views.decorators.cache import cache_control
+from django.views.decorators.http import condition
+
+from .models import Recipe, RecipeCollection
+
+
+def recipe_state(pk):
+    """``(author_id, last_modified)``; image and ingredient writes touch ``Recipe.updated_at``."""
+    return Recipe.objects.filter(pk=pk).values_list('author_id', 'updated_at').first()
+
+
+def collection_state(pk):
+    """``(user_id, last_modified)``, where a change to any member recipe counts as a change to the collection."""
+    row = (
+        RecipeCollection.objects.filter(pk=pk)
+        .annotate(newest_recipe=Max('recipes__updated_at'))
+        .values_list('user_id', 'updated_at', 'newest_recipe')
+        .first()
+    )
+    if row is None:
+        return None
+    owner_id, updated_at, newest_recipe = row
+    return owner_id, max(updated_at, newest_recipe or updated_at)
+
+
+def conditional_detail(load_state):
+    """
+    ``condition`` for a detail view's ``get``. ``load_state(pk)`` returns
+    ``(owner_id, last_modified)`` from a single-row query, or ``None`` so a
+    missing object falls through to the view's 404. The page differs per
+    viewer, so it is validated by ETag alone and kept out of shared caches;
+    a Last-Modified would let ``If-Modified-Since`` match another viewer's copy.
+    """
+    def state(request, pk):
+        if not hasattr(request, '_detail_state'):
+            request._detail_state = load_state(pk)
+        return request._detail_state
+
+    def etag(request, pk):
+        found = state(request, pk)
+        if found is None:
+            return None
+        owner_id, last_modified = found
+        # The page shows the viewer's name, owner-only Edit/Delete buttons and a
+        # CSRF token, so each of those is part of what makes two copies equal.
+        viewer = request.user.pk
+        get_token(request)  # Make sure the secret exists now, not only once the template renders.
+        parts = [
+            last_modified.isoformat(),
+            str(viewer),
+            str(viewer is not None and viewer == owner_id),
+            request.META['CSRF_COOKIE'],
+        ]
+        return hashlib.md5(':'.join(parts).encode()).hexdigest()
+
+    def decorator(view):
+        return cache_control(private=True)(condition(etag_func=etag)(view))
+
+    return decorator
@@ -0,0 +1,102 @@
+"""
+Catalogue dumps encoded row by row, for the export views and the
+``export_catalogue`` command. Querysets are read with ``.iterator()`` and
+their relations prefetched one chunk at a time, so memory use depends on the
+chunk size rather than on the size of the catalogue. Recipe rows use the
+layout ``import_recipes`` reads.
+"""
+import csv
+import json
+
+from django.db.models import Prefetch
+from django.http import StreamingHttpResponse
+from django.utils.duration import duration_string
+
+from .models import Recipe, RecipeImage, RecipeIngredient
+
+
+EXPORT_CHUNK_SIZE = 500
+
+RECIPE_COLUMNS = (
+    'id', 'title', 'author', 'servings', 'prepration_time', 'total_time', 'calories', 'instructions',
+    'featured', 'cuisine', 'food_type', 'difficulty', 'created_at', 'updated_at', 'ingredients', 'images',
+)
+COLLECTION_COLUMNS = ('id', 'title', 'user', 'recipes', 'created_at', 'updated_at')
+
+CONTENT_TYPES = {'jsonl': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def recipe_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    queryset = queryset.select_related('author').prefetch_related(
+        Prefetch('ingredients', queryset=RecipeIngredient.objects.order_by('pk')),
+        Prefetch('images', queryset=RecipeImage.objects.order_by('pk')),
+    )
+    for recipe in queryset.iterator(chunk_size=chunk_size):
+        yield {
+            'id': recipe.pk,
+            'title': recipe.title,
+            'author': recipe.author.username,
+            'servings': recipe.servings,
+            'prepration_time': duration_string(recipe.prepration_time),
+            'total_time': duration_string(recipe.total_time),
+            'calories': recipe.calories,
+            'instructions': recipe.instructions,
+            'featured': recipe.featured,
+            'cuisine': recipe.cuisine,
+            'food_type': recipe.food_type,
+            'difficulty': recipe.difficulty,
+            'created_at': recipe.created_at.isoformat(),
+            'updated_at': recipe.updated_at.isoformat(),
+            'ingredients': [
+                {'name': i.name, 'quantity': i.quantity, 'unit': i.unit, 'optional': i.optional}
+                for i in recipe.ingredients.all()
+            ],
+            'images': [{'image': i.image.name, 'description': i.description} for i in recipe.images.all()],
+        }
+
+
+def collection_rows(queryset, chunk_size=EXPORT_CHUNK_SIZE):
+    queryset = queryset.select_related('user').prefetch_related(
+        Prefetch('recipes', queryset=Recipe.objects.only('pk').order_by('pk'))
+    )
+    for collection in queryset.iterator(chunk_size=chunk_size):
+        yield {
+            'id': collection.pk,
+            'title': collection.title,
+            'user': collection.user.username,
+            'recipes': [recipe.pk for recipe in collection.recipes.all()],
+            'created_at': collection.created_at.isoformat(),
+            'updated_at': collection.updated_at.isoformat(),
+        }
+
+
+def encode_jsonl(rows, columns=None):
+    for row in rows:
+        yield json.dumps(row) + '\n'
+
+
+class _Echo:
+    """A file-like object whose ``write`` hands the formatted line back to the caller."""
+
+    def write(self, value):
+        return value
+
+
+def encode_csv(rows, columns):
+    """CSV lines with a header; list values such as ingredients become JSON cells."""
+    writer = csv.writer(_Echo())
+    yield writer.writerow(columns)
+    for row in rows:
+        yield writer.writerow(
+            json.dumps(row[column]) if isinstance(row[column], list) else row[column] for column in columns
+        )
+
+
+ENCODERS = {'jsonl': encode_jsonl, 'csv': encode_csv}
+
+
+def export_response(rows, columns, fmt, name):
+    """A download of ``rows`` encoded as ``fmt`` while the response is sent."""
+    response = StreamingHttpResponse(ENCODERS[fmt](rows, columns), content_type=CONTENT_TYPES[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{name}.{fmt}"'
+    return response
@@ -1,11 +1,21 @@
 from django import forms
 import django_filters
+from django.conf import settings
+from django.core.cache import cache
 from .models import Recipe,RecipeCollection
-from django.db.models import Q
+from django.db.models import Count, Q
+from .cache import catalogue_key, shared_cache_enabled
+from .search import get_search_backend
 
 
 class RecipeFilter(django_filters.FilterSet):
     
+    FACETS = {
+        'cuisine': Recipe.CuisineType,
+        'difficulty': Recipe.DifficultyLevel,
+        'food_type': Recipe.FoodType,
+    }
+    
     search = django_filters.CharFilter(method='recipe_search_filter', label='Search')
     
     cuisine = django_filters.ChoiceFilter(choices=Recipe.CuisineType.choices, label='Cuisine', empty_label='All Cuisine types')
@@ -43,15 +53,87 @@ class RecipeFilter(django_filters.FilterSet):
             return queryset.filter(author=self.user)
         return queryset
         
+    def canonical_params(self):
+        """
+        The cleaned filter values with everything that does not change the result
+        normalised away, so equivalent requests share cache entries. An invalid
+        form still filters by the fields that did validate, so those are used too.
+        """
+        self.is_valid()
+        data = getattr(self.form, 'cleaned_data', {})
+        return {
+            'search': ' '.join((data.get('search') or '').lower().split()),
+            # Kept apart so an anonymous ?user_filter=true (pk None) never shares the unfiltered key.
+            'user_filter': bool(data.get('user_filter')),
+            'user': getattr(self.user, 'pk', None) if data.get('user_filter') else None,
+            **{name: data.get(name) or None for name in self.FACETS},
+            **{name: list(data.get(name) or []) for name in ('sort_by_created', 'sort_by_calories')},
+        }
+
+    def cached_ids(self, featured):
+        """
+        The ordered ids of the featured or regular recipes this filter matches,
+        cached under the catalogue version. ``None`` when there are more than
+        ``RECIPE_RESULT_CACHE_MAX_IDS`` of them or the cache is not shared;
+        callers page the queryset instead.
+        """
+        if not shared_cache_enabled():
+            return None
+        limit = getattr(settings, 'RECIPE_RESULT_CACHE_MAX_IDS', 5000)
+        key = catalogue_key('ids', {**self.canonical_params(), 'featured': featured})
+        ids = cache.get(key)
+        if ids is None:
+            ids = list(self.qs.filter(featured=featured).prefetch_related(None).values_list('pk', flat=True)[:limit + 1])
+            if len(ids) > limit:
+                ids = False
+            cache.set(key, ids, getattr(settings, 'RECIPE_RESULT_CACHE_TIMEOUT', 300))
+        return ids if ids is not False else None
+
+    def facet_counts(self):
+        """
+        For every cuisine, difficulty and food type option, the number of recipes
+        matching it together with all the *other* active filters. All options are
+        counted in one aggregate query, cached until the catalogue next changes
+        when the cache is shared.
+        """
+        params = self.canonical_params()
+        active = {name: params[name] for name in self.FACETS if params[name]}
+
+        key = None
+        if shared_cache_enabled():
+            key = catalogue_key('facets', {
+                'search': params['search'], 'user_filter': params['user_filter'], 'user': params['user'], **active,
+            })
+        counts = cache.get(key) if key else None
+        if counts is None:
+            base = RecipeFilter(
+                {'search': params['search'], 'user_filter': params['user_filter']}, queryset=self.queryset, user=self.user
+            ).qs.select_related(None).prefetch_related(None).order_by()
+            aggregates = {}
+            for name, choices in self.FACETS.items():
+                others = Q(**{other: value for other, value in active.items() if other != name})
+                for value in choices.values:
+                    aggregates[f'{name}_{value}'] = Count('pk', filter=others & Q(**{name: value}))
+            counts = base.aggregate(**aggregates)
+            if key:
+                cache.set(key, counts, getattr(settings, 'RECIPE_FACET_CACHE_TIMEOUT', 300))
+
+        return {
+            name: [
+                {
+                    'value': str(value),
+                    'label': label,
+                    'count': counts[f'{name}_{value}'],
+                    'selected': active.get(name) == str(value),
+                }
+                for value, label in choices.choices
+            ]
+            for name, choices in self.FACETS.items()
+        }
+
     def recipe_search_filter(self, queryset, name, value):
-        cuisine_map = {str(v): k for k, v in dict(Recipe.CuisineType.choices).items()}
         if value:
-            return queryset.filter(
-                Q(title__icontains=value) | 
-                Q(author__username__icontains=value) | 
-                Q(cuisine__in=[k for v, k in cuisine_map.items() if value.lower() in v.lower()]) |
-                Q(ingredients__name__icontains=value)
-            ).distinct()
+            return get_search_backend().search(queryset, value)
         return queryset
 
 
@@ -75,10 +157,12 @@ class RecipeCollectionFilter(django_filters.FilterSet):
     
     def collection_search_filter(self, queryset, name, value):
         if value:
+            matching_recipes = Recipe.objects.filter(get_search_backend().match(value)).values('pk')
+            memberships = RecipeCollection.recipes.through.objects.filter(recipe_id__in=matching_recipes)
             return queryset.filter(
                 Q(title__icontains=value) | 
-                Q(recipes__title__icontains=value) |
+                Q(pk__in=memberships.values('recipecollection_id')) |
                 Q(user__username__icontains=value)
-            ).distinct()
+            )
         return queryset
     
\ No newline at end of file
@@ -54,10 +54,25 @@ RecipeImageFormSet = inlineformset_factory(
 )
 
 
+class SelectedRecipesWidget(forms.CheckboxSelectMultiple):
+    """
+    Checkboxes for the selected recipes only, looked up in one query. Others are
+    found through the recipe picker endpoint and added in the browser.
+    """
+
+    def optgroups(self, name, value, attrs=None):
+        ids = [v for v in value if str(v).isdigit()]
+        recipes = self.choices.queryset.filter(pk__in=ids) if ids else []
+        return [
+            (None, [self.create_option(name, recipe.pk, self.choices.field.label_from_instance(recipe), True, index, attrs=attrs)], index)
+            for index, recipe in enumerate(recipes)
+        ]
+
+
 class RecipeCollectionForm(forms.ModelForm):
     recipes = forms.ModelMultipleChoiceField(
-        queryset=Recipe.objects.all(),
-        widget=forms.CheckboxSelectMultiple,
+        queryset=Recipe.objects.only('pk', 'title'),
+        widget=SelectedRecipesWidget,
         required=True,  
         label='Select Recipes'  
     )
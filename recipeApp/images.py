@@ -0,0 +1,130 @@
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.utils import timezone
+
+from .cache import bump_page_version
+from .models import Recipe, RecipeImage
+from .variants import FORMATS, render_variants
+
+
+logger = logging.getLogger(__name__)
+
+# name: (width, height, crop). Card and tile are drawn object-cover at about
+# 400x192 and 128x128 CSS pixels, so they are rendered at twice that.
+VARIANTS = {
+    'tile': (256, 256, True),
+    'card': (800, 384, True),
+    'detail': (1280, 1280, False),
+}
+
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+
+def variant_name(source_name, variant, fmt):
+    """Storage name of one variant: ``variants/<source name without extension>/<variant>.<ext>``."""
+    stem = os.path.splitext(source_name)[0]
+    return f'variants/{stem}/{variant}.{EXTENSIONS[fmt]}'
+
+
+def variant_targets(image):
+    """``render_variants`` targets for ``image``, with the storage names they map to."""
+    storage = image.image.storage
+    names = {
+        variant: {fmt: variant_name(image.image.name, variant, fmt) for fmt in FORMATS}
+        for variant in VARIANTS
+    }
+    targets = [
+        (variant, width, height, crop, {fmt: storage.path(name) for fmt, name in names[variant].items()})
+        for variant, (width, height, crop) in VARIANTS.items()
+    ]
+    return targets, names
+
+
+def generate_variants(image_id):
+    """Render and record every variant of one image in this process."""
+    image = RecipeImage.objects.filter(pk=image_id).first()
+    if image is None or not image.image:
+        return
+    targets, names = variant_targets(image)
+    save_variants(image_id, image.image.name, names, render_variants(image.image.path, targets))
+
+
+def save_variants(image_id, source_name, names, sizes):
+    variants = {
+        variant: {'width': width, 'height': height, 'formats': names[variant]}
+        for variant, (width, height) in sizes.items()
+    }
+    # Matching on the source name drops results for a file that was replaced meanwhile.
+    if RecipeImage.objects.filter(pk=image_id, image=source_name).update(variants=variants):
+        Recipe.objects.filter(images=image_id).update(updated_at=timezone.now())
+        bump_page_version()
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.IMAGE_VARIANT_WORKERS,
+                # Workers only import recipeApp.variants; forking would copy the
+                # parent's database connections and threads into them.
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _executor
+
+
+def schedule_variants(image_id):
+    """
+    Render an image's variants without blocking the caller: in the process pool,
+    or inline when ``IMAGE_VARIANT_WORKERS`` is 0.
+    """
+    if not getattr(settings, 'IMAGE_VARIANT_WORKERS', 0):
+        try:
+            generate_variants(image_id)
+        except Exception:
+            logger.exception('Could not render variants for recipe image %s', image_id)
+        return
+
+    image = RecipeImage.objects.filter(pk=image_id).first()
+    if image is None or not image.image:
+        return
+    try:
+        targets, names = variant_targets(image)
+    except NotImplementedError:
+        logger.warning('Recipe image variants need a storage with local paths; skipping image %s', image_id)
+        return
+    future = get_executor().submit(render_variants, image.image.path, targets)
+
+    def done(future):
+        try:
+            save_variants(image_id, image.image.name, names, future.result())
+        except Exception:
+            logger.exception('Could not render variants for recipe image %s', image_id)
+        finally:
+            # This runs on the pool's own thread, which keeps no connection between jobs.
+            connections.close_all()
+
+    future.add_done_callback(done)
+
+
+def refresh_variants(images):
+    """
+    Forget the variants of images whose file just changed and render new ones
+    once the transaction commits. Until then the templates show the original.
+    """
+    stale = [image.pk for image in images if image.variants]
+    if stale:
+        RecipeImage.objects.filter(pk__in=stale).update(variants={})
+    for image in images:
+        image.variants = {}
+        transaction.on_commit(lambda image_id=image.pk: schedule_variants(image_id))
@@ -0,0 +1,131 @@
+import itertools
+import random
+import re
+import statistics
+import time
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from recipeApp.filters import RecipeFilter
+from recipeApp.models import Recipe
+
+
+SORTS = [
+    {},
+    {'sort_by_created': 'created_at'},
+    {'sort_by_calories': 'calories'},
+    {'sort_by_calories': '-calories'},
+]
+
+FILTERS = [
+    {},
+    {'cuisine': str(Recipe.CuisineType.SOUTH_INDIAN)},
+    {'food_type': str(Recipe.FoodType.VEGAN)},
+    {'difficulty': str(Recipe.DifficultyLevel.HARD)},
+    {'cuisine': str(Recipe.CuisineType.CHINESE), 'food_type': str(Recipe.FoodType.NON_VEGETARIAN)},
+    {'user_filter': 'true'},
+]
+
+
+def plan_problems(plan, vendor):
+    """Return the lines of a query plan that read the whole recipe table or sort it without an index."""
+    problems = []
+    for line in plan.splitlines():
+        if vendor == 'sqlite':
+            if re.search(r'SCAN "?recipeApp_recipe"?\s*$', line) or 'USE TEMP B-TREE FOR ORDER BY' in line:
+                problems.append(line.strip())
+        elif vendor == 'postgresql':
+            if re.search(r'Seq Scan on "?recipeApp_recipe"?\b', line):
+                problems.append(line.strip())
+    return problems
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed recipes, run every RecipeFilter filter/sort combination the list page can issue "
+        "and report each query plan and timing. With --strict, any combination that scans or "
+        "sorts the whole recipe table fails the command."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipes', type=int, default=20000, help="Recipes to seed (default 20000).")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per combination (default 5).")
+        parser.add_argument('--page-size', type=int, default=3)
+        parser.add_argument('--keep', action='store_true', help="Keep the seeded rows instead of rolling back.")
+        parser.add_argument('--strict', action='store_true', help="Exit non-zero when an index is not used.")
+        parser.add_argument('--verbose-plans', action='store_true', help="Print full plans, not just the summary.")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                failures = self.run(options)
+                if not options['keep']:
+                    raise Rollback
+        except Rollback:
+            pass
+
+        if failures and options['strict']:
+            raise CommandError(f"{len(failures)} combination(s) did not use an index: " + '; '.join(failures))
+
+    def run(self, options):
+        vendor = connection.vendor
+        user = self.seed(options['recipes'])
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+        self.stdout.write(f"{vendor}: {options['recipes']} recipes, {options['repeat']} runs per combination")
+        failures = []
+        for featured, sort, filters in itertools.product((True, False), SORTS, FILTERS):
+            params = {**filters, **sort}
+            queryset = RecipeFilter(params, queryset=Recipe.objects.order_by('-created_at'), user=user).qs
+            queryset = queryset.filter(featured=featured)[:options['page_size']]
+
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - started) * 1000)
+
+            plan = queryset.explain()
+            problems = plan_problems(plan, vendor)
+            label = f"featured={featured!s:<5} " + (' '.join(f'{k}={v}' for k, v in params.items()) or '(default)')
+            status = self.style.ERROR('NO INDEX') if problems else self.style.SUCCESS('ok')
+            self.stdout.write(f"{label:<70} {statistics.median(timings):8.3f} ms  {status}")
+            if options['verbose_plans'] or problems:
+                for line in plan.splitlines():
+                    self.stdout.write(f"    {line}")
+            if problems:
+                failures.append(label)
+        return failures
+
+    def seed(self, count):
+        user, _ = User.objects.get_or_create(username='benchmark-user')
+        other, _ = User.objects.get_or_create(username='benchmark-other')
+        rng = random.Random(0)
+        batch = []
+        for i in range(count):
+            batch.append(Recipe(
+                author=user if rng.random() < 0.05 else other,
+                title=f'Benchmark recipe {i}',
+                servings=rng.randint(1, 8),
+                prepration_time=timedelta(minutes=rng.randint(5, 60)),
+                total_time=timedelta(minutes=rng.randint(60, 120)),
+                calories=rng.randint(50, 1500),
+                instructions='Benchmark.',
+                featured=rng.random() < 0.05,
+                cuisine=rng.choice(Recipe.CuisineType.values),
+                food_type=rng.choice(Recipe.FoodType.values),
+                difficulty=rng.choice(Recipe.DifficultyLevel.values),
+            ))
+            if len(batch) == 1000:
+                Recipe.objects.bulk_create(batch)
+                batch = []
+        Recipe.objects.bulk_create(batch)
+        return user
@@ -0,0 +1,151 @@
+import os
+import shutil
+import time
+from datetime import timedelta
+from functools import reduce
+from itertools import islice
+from operator import or_
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from recipeApp.models import ImageBlob, RecipeImage
+
+
+UPLOAD_DIR = 'recipe_images'
+VARIANT_DIR = 'variants'
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete or quarantine recipe image files and rendered variants that no RecipeImage "
+        "refers to any more. Uploads whose ImageBlob lost its last reference before the grace period "
+        "go first; MEDIA_ROOT is then walked with os.scandir and checked a batch at a time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report orphaned files without touching them.")
+        parser.add_argument(
+            '--grace-hours', type=float, default=24,
+            help=(
+                "Leave files modified, and blobs released, more recently than this alone; "
+                "uploads are written before their row commits."
+            ),
+        )
+        parser.add_argument('--batch-size', type=int, default=500, help="Files checked per database query.")
+        parser.add_argument('--quarantine', metavar='DIR', help="Move orphaned files here instead of deleting them.")
+
+    def handle(self, *args, **options):
+        self.root = os.path.normpath(settings.MEDIA_ROOT)
+        self.options = options
+        self.cutoff = time.time() - options['grace_hours'] * 3600
+        self.files = self.bytes = 0
+        self.emptied = set()
+        self.collected = set()
+
+        self.collect_unreferenced_blobs(timezone.now() - timedelta(hours=options['grace_hours']))
+        for top, find_referenced in ((UPLOAD_DIR, self.referenced_uploads), (VARIANT_DIR, self.referenced_variants)):
+            candidates = (entry for entry in self.scan(top) if entry[1] < self.cutoff)
+            while batch := list(islice(candidates, options['batch_size'])):
+                referenced = find_referenced([name for name, _, _ in batch])
+                for name, _, size in batch:
+                    if name not in referenced and name not in self.collected:
+                        self.collect(name, size)
+
+        if not options['dry_run']:
+            self.prune_directories()
+        if options['dry_run']:
+            verb = "would be collected"
+        else:
+            verb = "quarantined" if options['quarantine'] else "deleted"
+        self.stdout.write(f"{self.files} orphaned files ({self.bytes} bytes) {verb}.")
+
+    def scan(self, top):
+        """Yield ``(name, mtime, size)`` for every file under ``top``, one directory listing at a time."""
+        stack = [os.path.join(self.root, top)]
+        while stack:
+            try:
+                entries = os.scandir(stack.pop())
+            except FileNotFoundError:
+                continue
+            with entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        stat = entry.stat(follow_symlinks=False)
+                        name = os.path.relpath(entry.path, self.root).replace(os.sep, '/')
+                        yield name, stat.st_mtime, stat.st_size
+
+    def collect_unreferenced_blobs(self, released_before):
+        """
+        Collect uploads, with their variants, whose reference count reached
+        zero before ``released_before``. The grace period runs from the
+        release rather than from the file's mtime, which identical uploads
+        keep refreshing.
+        """
+        stale = ImageBlob.objects.unreferenced().filter(updated_at__lt=released_before)
+        for name in stale.values_list('name', flat=True).iterator():
+            # Deleting the row first re-checks the count against an upload retaining it meanwhile.
+            if not self.options['dry_run'] and not ImageBlob.objects.filter(name=name, references=0).delete()[0]:
+                continue
+            stem = os.path.splitext(name)[0]
+            for variant, _, size in self.scan(f'{VARIANT_DIR}/{stem}'):
+                self.collect(variant, size, recheck=False)
+            try:
+                size = os.stat(os.path.join(self.root, name)).st_size
+            except FileNotFoundError:
+                continue
+            self.collect(name, size, recheck=False)
+
+    def referenced_uploads(self, names):
+        return set(RecipeImage.objects.filter(image__in=names).values_list('image', flat=True))
+
+    def referenced_variants(self, names):
+        # variants/<source name without extension>/<variant>.<ext>
+        stems = {name: os.path.dirname(name)[len(VARIANT_DIR) + 1:] for name in names}
+        lookups = [Q(image__startswith=f'{stem}.') for stem in set(stems.values()) if stem]
+        if not lookups:
+            return set()
+        sources = RecipeImage.objects.filter(reduce(or_, lookups)).values_list('image', flat=True)
+        live = {os.path.splitext(source)[0] for source in sources}
+        return {name for name, stem in stems.items() if stem in live}
+
+    def collect(self, name, size, recheck=True):
+        self.collected.add(name)
+        self.files += 1
+        self.bytes += size
+        if self.options['verbosity'] > 1:
+            self.stdout.write(name)
+        if self.options['dry_run']:
+            return
+
+        path = os.path.join(self.root, name)
+        try:
+            if recheck and os.stat(path).st_mtime >= self.cutoff:
+                # Stored again since the scan; identical uploads reuse the file and touch it.
+                return
+            if self.options['quarantine']:
+                destination = os.path.join(self.options['quarantine'], name)
+                os.makedirs(os.path.dirname(destination), exist_ok=True)
+                shutil.move(path, destination)
+            else:
+                os.remove(path)
+        except FileNotFoundError:
+            return
+        if name.startswith(f'{UPLOAD_DIR}/'):
+            ImageBlob.objects.filter(name=name, references=0).delete()
+        self.emptied.add(os.path.dirname(path))
+
+    def prune_directories(self):
+        """Remove directories the collected files leave empty, up to the top-level media directories."""
+        tops = {os.path.join(self.root, top) for top in (UPLOAD_DIR, VARIANT_DIR)}
+        for directory in sorted(self.emptied, key=len, reverse=True):
+            while directory not in tops and directory.startswith(self.root + os.sep):
+                try:
+                    os.rmdir(directory)
+                except OSError:
+                    break
+                directory = os.path.dirname(directory)
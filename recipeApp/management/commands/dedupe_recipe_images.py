@@ -0,0 +1,83 @@
+import hashlib
+import os
+import posixpath
+import shutil
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipeApp.images import generate_variants
+from recipeApp.models import ImageBlob, RecipeImage
+from recipeApp.storage import recipe_image_storage
+
+
+class Command(BaseCommand):
+    help = (
+        "Move recipe images saved before content-addressed storage to their hashed names, "
+        "point duplicate rows at one copy and recount ImageBlob references."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report what would move without writing.")
+
+    def handle(self, *args, **options):
+        storage = recipe_image_storage()
+        names = RecipeImage.objects.exclude(image='').values_list('image', flat=True).distinct().order_by()
+
+        moves = {}
+        for name in names.iterator():
+            if not storage.exists(name):
+                self.stderr.write(f"Missing file for {name}; left as is.")
+                continue
+            stored_name = self.addressed_name(storage, name)
+            if stored_name != name:
+                moves[name] = stored_name
+
+        duplicates = len(moves) - len(set(moves.values()))
+        verb = "would be" if options['dry_run'] else "were"
+        if options['dry_run']:
+            self.stdout.write(f"{len(moves)} files {verb} renamed, {duplicates} of them duplicates.")
+            return
+
+        for name, stored_name in moves.items():
+            if not storage.exists(stored_name):
+                os.makedirs(os.path.dirname(storage.path(stored_name)), exist_ok=True)
+                shutil.copy2(storage.path(name), storage.path(stored_name))
+
+        with transaction.atomic():
+            image_ids = []
+            for name, stored_name in moves.items():
+                rows = RecipeImage.objects.filter(image=name)
+                image_ids.extend(rows.values_list('pk', flat=True))
+                rows.update(image=stored_name, variants={})
+            ImageBlob.objects.bulk_create(
+                [ImageBlob(name=name) for name in set(moves.values())], ignore_conflicts=True
+            )
+            drifted = ImageBlob.objects.recount()
+            # The old copies only go once the rows no longer point at them.
+            transaction.on_commit(lambda: self.remove_originals(storage, moves))
+
+        for image_id in image_ids:
+            try:
+                generate_variants(image_id)
+            except Exception as error:
+                self.stderr.write(f"Could not render variants for recipe image {image_id}: {error}")
+
+        self.stdout.write(f"{len(moves)} files {verb} renamed, {duplicates} of them duplicates.")
+        self.stdout.write(f"{drifted} image reference counts repaired.")
+
+    def addressed_name(self, storage, name):
+        digest = hashlib.sha256()
+        with storage.open(name, 'rb') as source:
+            for chunk in source.chunks(storage.chunk_size):
+                digest.update(chunk)
+        hexdigest = digest.hexdigest()
+        directory = posixpath.dirname(name).split('/')[0]
+        extension = os.path.splitext(name)[1].lower()
+        return posixpath.join(directory, hexdigest[:2], hexdigest + extension)
+
+    def remove_originals(self, storage, moves):
+        for name in moves:
+            storage.delete(name)
+            stem = os.path.splitext(name)[0]
+            shutil.rmtree(storage.path(f'variants/{stem}'), ignore_errors=True)
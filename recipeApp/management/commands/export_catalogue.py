@@ -0,0 +1,57 @@
+from django import forms
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.http import QueryDict
+
+from recipeApp.exports import (
+    COLLECTION_COLUMNS, ENCODERS, EXPORT_CHUNK_SIZE, RECIPE_COLUMNS, collection_rows, recipe_rows,
+)
+from recipeApp.filters import RecipeCollectionFilter, RecipeFilter
+from recipeApp.models import Recipe, RecipeCollection
+
+
+class Command(BaseCommand):
+    help = (
+        "Write every recipe or collection as JSON Lines or CSV, a chunk at a time. --filter takes "
+        "the list page's query parameters, e.g. --filter 'cuisine=3&search=tofu'; user_filter "
+        "needs --user to say whose recipes or collections to keep."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=['recipes', 'collections'])
+        parser.add_argument('--format', choices=sorted(ENCODERS), default='jsonl')
+        parser.add_argument('--output', help="File to write; standard output by default.")
+        parser.add_argument('--filter', default='', help="RecipeFilter or RecipeCollectionFilter parameters.")
+        parser.add_argument('--user', metavar='USERNAME', help="The user user_filter narrows the export to.")
+        parser.add_argument('--chunk-size', type=int, default=EXPORT_CHUNK_SIZE, help="Rows fetched per query.")
+
+    def handle(self, *args, **options):
+        params = QueryDict(options['filter'])
+        user = None
+        if options['user']:
+            try:
+                user = User.objects.get(username=options['user'])
+            except User.DoesNotExist:
+                raise CommandError(f"No user named {options['user']!r}.")
+        elif forms.NullBooleanField().to_python(params.get('user_filter')):
+            raise CommandError("user_filter needs --user.")
+
+        if options['kind'] == 'recipes':
+            filterset = RecipeFilter(params, queryset=Recipe.objects.order_by('-created_at'), user=user)
+            rows, columns = recipe_rows, RECIPE_COLUMNS
+        else:
+            filterset = RecipeCollectionFilter(
+                params, queryset=RecipeCollection.objects.order_by('-created_at'), user=user
+            )
+            rows, columns = collection_rows, COLLECTION_COLUMNS
+        if not filterset.is_valid():
+            raise CommandError(f"Invalid filter: {filterset.errors.as_text()}")
+
+        lines = ENCODERS[options['format']](rows(filterset.qs, options['chunk_size']), columns)
+        output = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else self.stdout
+        try:
+            for line in lines:
+                output.write(line)
+        finally:
+            if options['output']:
+                output.close()
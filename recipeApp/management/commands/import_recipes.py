@@ -0,0 +1,174 @@
+import csv
+import io
+import json
+import os
+import sys
+import time
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.exceptions import SuspiciousFileOperation
+from django.core.management.base import BaseCommand, CommandError
+
+from recipeApp.forms import RecipeForm, RecipeIngredientForm
+from recipeApp.models import RecipeImage
+from recipeApp.storage import recipe_image_storage
+from recipeApp.writes import create_recipes
+
+
+class Command(BaseCommand):
+    help = (
+        "Import recipes from JSON Lines or CSV, one recipe per line or row. Each row holds the "
+        "RecipeForm fields, 'author' (a username), 'ingredients' (a list of RecipeIngredientForm "
+        "fields) and optionally 'images' (a list of {'image': stored name, 'description': ...}). "
+        "In CSV, 'ingredients' and 'images' are JSON-encoded cells."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="Input file, or - for standard input.")
+        parser.add_argument('--format', choices=['jsonl', 'csv'], help="Defaults to the file extension.")
+        parser.add_argument('--batch-size', type=int, default=500, help="Recipes written per transaction.")
+        parser.add_argument(
+            '--checkpoint', metavar='FILE',
+            help="Record how many input rows are committed after each batch, and skip that many when it exists.",
+        )
+
+    def handle(self, *args, **options):
+        fmt = options['format'] or ('csv' if options['path'].lower().endswith('.csv') else 'jsonl')
+        checkpoint = options['checkpoint']
+        done = self.read_checkpoint(checkpoint) if checkpoint else 0
+        self.storage = recipe_image_storage()
+
+        # Bytes that are not UTF-8 come through as lone surrogates, and parse() rejects
+        # the rows holding them instead of the decoder ending the whole import.
+        if options['path'] == '-':
+            source = io.TextIOWrapper(sys.stdin.buffer, encoding='utf-8', errors='surrogateescape', newline='')
+        else:
+            source = open(options['path'], newline='', encoding='utf-8', errors='surrogateescape')
+        imported = rejected = 0
+        with source:
+            rows = enumerate(self.rows(source, fmt), start=1)
+            if done:
+                self.stdout.write(f"Resuming after row {done}.")
+                rows = islice(rows, done, None)
+            while batch := list(islice(rows, options['batch_size'])):
+                started = time.perf_counter()
+                entries = self.build(batch)
+                if entries:
+                    create_recipes(entries)
+                done = batch[-1][0]
+                if checkpoint:
+                    self.write_checkpoint(checkpoint, done)
+
+                elapsed = time.perf_counter() - started
+                imported += len(entries)
+                rejected += len(batch) - len(entries)
+                self.stdout.write(
+                    f"Rows {batch[0][0]}-{done}: {len(entries)} imported, {len(batch) - len(entries)} rejected, "
+                    f"{len(batch) / elapsed:.0f} rows/s."
+                )
+
+        self.stdout.write(self.style.SUCCESS(f"Imported {imported} recipes; rejected {rejected} rows."))
+
+    def rows(self, source, fmt):
+        """Raw input rows, parsed later so one malformed row is rejected rather than ending the import."""
+        if fmt == 'csv':
+            yield from csv.DictReader(source)
+        else:
+            yield from (line for line in source if line.strip())
+
+    def parse(self, raw):
+        for value in [raw] if isinstance(raw, str) else [*raw.keys(), *raw.values()]:
+            if isinstance(value, str):
+                try:
+                    value.encode('utf-8')
+                except UnicodeEncodeError:
+                    raise ValueError("not valid UTF-8")
+        if isinstance(raw, str):
+            row = json.loads(raw)
+            if not isinstance(row, dict):
+                raise ValueError("expected a JSON object")
+        else:
+            row = raw
+            for key in ('ingredients', 'images'):
+                row[key] = json.loads(row[key]) if row.get(key) else []
+
+        if not isinstance(row.get('author'), (str, type(None))):
+            raise ValueError("'author' must be a username")
+        for key in ('ingredients', 'images'):
+            value = row.get(key) or []
+            if not isinstance(value, list) or not all(isinstance(item, dict) for item in value):
+                raise ValueError(f"'{key}' must be a list of objects")
+        return row
+
+    def build(self, batch):
+        """Validate one batch of ``(row number, raw row)``; returns unsaved instances for the valid rows."""
+        parsed = []
+        for number, raw in batch:
+            try:
+                parsed.append((number, self.parse(raw)))
+            except ValueError as error:
+                self.stderr.write(f"Row {number} rejected: {error}")
+        # Looked up per batch, so memory stays bounded however many authors the input names.
+        authors = self.resolve_authors({row.get('author') for _, row in parsed})
+
+        entries = []
+        for number, row in parsed:
+            errors = {}
+            author_id = authors.get(row.get('author'))
+            if author_id is None:
+                errors['author'] = [f"No user named {row.get('author')!r}."]
+
+            form = RecipeForm(data=row)
+            if not form.is_valid():
+                errors.update((field, list(messages)) for field, messages in form.errors.items())
+            ingredients = []
+            for position, data in enumerate(row.get('ingredients') or []):
+                ingredient_form = RecipeIngredientForm(data=data)
+                if ingredient_form.is_valid():
+                    ingredients.append(ingredient_form.save(commit=False))
+                else:
+                    errors[f'ingredients[{position}]'] = {
+                        field: list(messages) for field, messages in ingredient_form.errors.items()
+                    }
+            images = []
+            for position, data in enumerate(row.get('images') or []):
+                name = data.get('image', '')
+                try:
+                    exists = isinstance(name, str) and bool(name) and self.storage.exists(name)
+                except SuspiciousFileOperation:
+                    exists = False
+                if exists:
+                    images.append(RecipeImage(image=name, description=data.get('description') or None))
+                else:
+                    errors[f'images[{position}]'] = [f"No stored image named {name!r}."]
+
+            if errors:
+                self.stderr.write(f"Row {number} rejected: {json.dumps(errors)}")
+                continue
+            recipe = form.save(commit=False)
+            recipe.author_id = author_id
+            entries.append((recipe, ingredients, images))
+        return entries
+
+    def resolve_authors(self, usernames):
+        """Map each username to its user id in one query; unknown names are left out."""
+        usernames = {name for name in usernames if isinstance(name, str) and name}
+        if not usernames:
+            return {}
+        return dict(User.objects.filter(username__in=usernames).values_list('username', 'pk'))
+
+    def read_checkpoint(self, path):
+        try:
+            with open(path) as checkpoint:
+                return json.load(checkpoint)['rows']
+        except FileNotFoundError:
+            return 0
+        except (ValueError, KeyError) as error:
+            raise CommandError(f"Unreadable checkpoint {path}: {error}")
+
+    def write_checkpoint(self, path, rows):
+        partial = f'{path}.part'
+        with open(partial, 'w') as checkpoint:
+            json.dump({'rows': rows}, checkpoint)
+        os.replace(partial, path)
@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipeApp.models import Recipe, RecipeCollection
+
+
+class Command(BaseCommand):
+    help = "Recompute Recipe.num_ingredients and RecipeCollection.num_recipes and fix any that drifted."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help="Report drift without writing.")
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            recipes = Recipe.objects.recount_ingredients()
+            collections = RecipeCollection.objects.recount_recipes()
+            if options['dry_run']:
+                transaction.set_rollback(True)
+
+        verb = "would be repaired" if options['dry_run'] else "repaired"
+        self.stdout.write(f"{recipes} recipe ingredient counts {verb}.")
+        self.stdout.write(f"{collections} collection recipe counts {verb}.")
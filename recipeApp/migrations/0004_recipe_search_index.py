@@ -0,0 +1,63 @@
+from django.db import migrations
+
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE "recipeApp_recipe_search" USING fts5(
+        title, author, cuisine, ingredients,
+        tokenize = 'unicode61 remove_diacritics 2',
+        prefix = '2 3'
+    )
+    """,
+    """
+    INSERT INTO "recipeApp_recipe_search" (rowid, title, author, cuisine, ingredients)
+    SELECT r.id, r.title, u.username,
+           CASE r.cuisine WHEN 1 THEN 'South Indian' WHEN 2 THEN 'North Indian' WHEN 3 THEN 'Chinese' ELSE '' END,
+           COALESCE((SELECT group_concat(i.name, ' ') FROM "recipeApp_recipeingredient" i WHERE i.recipe_id = r.id), '')
+    FROM "recipeApp_recipe" r JOIN "auth_user" u ON u.id = r.author_id
+    """,
+]
+
+POSTGRES_FORWARD = [
+    """
+    CREATE TABLE "recipeApp_recipe_search" (
+        recipe_id bigint PRIMARY KEY REFERENCES "recipeApp_recipe" (id) ON DELETE CASCADE DEFERRABLE INITIALLY DEFERRED,
+        document tsvector NOT NULL
+    )
+    """,
+    'CREATE INDEX "recipeApp_recipe_search_document_gin" ON "recipeApp_recipe_search" USING GIN (document)',
+    """
+    INSERT INTO "recipeApp_recipe_search" (recipe_id, document)
+    SELECT r.id,
+           setweight(to_tsvector('simple', r.title), 'A') ||
+           setweight(to_tsvector('simple', u.username), 'B') ||
+           setweight(to_tsvector('simple', CASE r.cuisine WHEN 1 THEN 'South Indian' WHEN 2 THEN 'North Indian'
+                                                          WHEN 3 THEN 'Chinese' ELSE '' END), 'B') ||
+           setweight(to_tsvector('simple', COALESCE((SELECT string_agg(i.name, ' ') FROM "recipeApp_recipeingredient" i
+                                                     WHERE i.recipe_id = r.id), '')), 'C')
+    FROM "recipeApp_recipe" r JOIN "auth_user" u ON u.id = r.author_id
+    """,
+]
+
+
+def create_search_index(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    statements = {'sqlite': SQLITE_FORWARD, 'postgresql': POSTGRES_FORWARD}.get(vendor, [])
+    for statement in statements:
+        schema_editor.execute(statement)
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor in ('sqlite', 'postgresql'):
+        schema_editor.execute('DROP TABLE IF EXISTS "recipeApp_recipe_search"')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("recipeApp", "0003_remove_recipe_image_alter_recipe_author_and_more"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:20
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    Recipe = apps.get_model('recipeApp', 'Recipe')
+    RecipeIngredient = apps.get_model('recipeApp', 'RecipeIngredient')
+    RecipeCollection = apps.get_model('recipeApp', 'RecipeCollection')
+    Membership = RecipeCollection.recipes.through
+
+    ingredients = RecipeIngredient.objects.filter(recipe=OuterRef('pk')).order_by().values('recipe').annotate(n=Count('*')).values('n')
+    Recipe.objects.update(num_ingredients=Coalesce(Subquery(ingredients), 0))
+
+    members = Membership.objects.filter(recipecollection=OuterRef('pk')).order_by().values('recipecollection').annotate(n=Count('*')).values('n')
+    RecipeCollection.objects.update(num_recipes=Coalesce(Subquery(members), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipeApp', '0004_recipe_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='num_ingredients',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='recipecollection',
+            name='num_recipes',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
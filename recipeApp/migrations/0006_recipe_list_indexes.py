@@ -0,0 +1,47 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:21
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipeApp', '0005_recipe_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('featured', True)), fields=['created_at', 'id'], name='recipe_featured_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('featured', True)), fields=['calories', 'id'], name='recipe_featured_cal_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('featured', False)), fields=['created_at', 'id'], name='recipe_regular_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(condition=models.Q(('featured', False)), fields=['calories', 'id'], name='recipe_regular_cal_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['featured', 'cuisine', 'created_at'], name='recipe_cuisine_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['featured', 'food_type', 'created_at'], name='recipe_food_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['featured', 'difficulty', 'created_at'], name='recipe_difficulty_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', 'featured', 'created_at'], name='recipe_author_featured_idx'),
+        ),
+    ]
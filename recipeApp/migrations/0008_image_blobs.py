@@ -0,0 +1,38 @@
+# Generated by Django 5.1.2 on 2026-10-18 19:55
+
+import recipeApp.storage
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_blobs(apps, schema_editor):
+    RecipeImage = apps.get_model('recipeApp', 'RecipeImage')
+    ImageBlob = apps.get_model('recipeApp', 'ImageBlob')
+    rows = RecipeImage.objects.exclude(image='').values('image').annotate(n=Count('*')).order_by()
+    ImageBlob.objects.bulk_create(ImageBlob(name=row['image'], references=row['n']) for row in rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipeApp', '0007_recipeimage_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageBlob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=255, unique=True)),
+                ('references', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AlterField(
+            model_name='recipeimage',
+            name='image',
+            field=models.ImageField(storage=recipeApp.storage.recipe_image_storage, upload_to='recipe_images/'),
+        ),
+        migrations.RunPython(populate_blobs, migrations.RunPython.noop),
+    ]
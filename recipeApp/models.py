@@ -1,8 +1,67 @@
+from collections import Counter
 from django.db import models
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce, Greatest
 from django.contrib.auth.models import User
+from django.urls import reverse
+from django.utils import timezone
+from .storage import recipe_image_storage
 
 
-class Recipe(models.Model):
+def _count_of(queryset, field, outer='pk'):
+    """Correlated ``COUNT`` of ``queryset`` rows whose ``field`` matches the outer row's ``outer``, 0 when none."""
+    counts = queryset.filter(**{field: OuterRef(outer)}).order_by().values(field).annotate(n=Count('*')).values('n')
+    return Coalesce(Subquery(counts), 0)
+
+
+class CounterFieldsMixin:
+    """
+    Leave ``counter_fields`` out of saves of existing rows. The counters are
+    moved with ``F()`` updates as related rows change, and an instance loaded
+    before such an update would otherwise write its stale copy back over it.
+    """
+
+    counter_fields = ()
+
+    def save(self, *args, update_fields=None, **kwargs):
+        if update_fields is None and not self._state.adding and not kwargs.get('force_insert'):
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.counter_fields
+            ]
+        super().save(*args, update_fields=update_fields, **kwargs)
+
+
+class RecipeQuerySet(models.QuerySet):
+
+    def with_cover_image(self):
+        """Prefetch only the first image of every recipe in one batched query."""
+        return self.prefetch_related(
+            models.Prefetch(
+                'images',
+                queryset=RecipeImage.objects.order_by('pk')[:1],
+                to_attr='cover_images',
+            )
+        )
+
+    def for_listing(self):
+        """Everything a recipe card needs: the author joined in, the cover image prefetched."""
+        return self.select_related('author').with_cover_image()
+
+    def for_detail(self):
+        """The author joined in and every image and ingredient prefetched, in a fixed three queries."""
+        return self.select_related('author').prefetch_related(
+            models.Prefetch('images', queryset=RecipeImage.objects.order_by('pk')),
+            models.Prefetch('ingredients', queryset=RecipeIngredient.objects.order_by('pk')),
+        )
+
+    def recount_ingredients(self):
+        """Repair ``num_ingredients`` in one UPDATE; returns how many rows had drifted."""
+        actual = _count_of(RecipeIngredient.objects.all(), 'recipe')
+        return self.exclude(num_ingredients=actual).update(num_ingredients=actual)
+
+
+class Recipe(CounterFieldsMixin, models.Model):
             
     class FoodType(models.IntegerChoices):
         VEGETARIAN = 1, 'Veg'
@@ -35,9 +94,35 @@ class Recipe(models.Model):
     cuisine = models.PositiveSmallIntegerField(choices=CuisineType.choices)
     food_type = models.PositiveSmallIntegerField(choices=FoodType.choices)
     difficulty = models.PositiveSmallIntegerField(choices=DifficultyLevel.choices)
+    num_ingredients = models.PositiveIntegerField(default=0, editable=False)
+    
+    objects = RecipeQuerySet.as_manager()
+    counter_fields = ('num_ingredients',)
+    
+    class Meta:
+        # The list page always splits on ``featured`` and orders by created_at or
+        # calories, optionally narrowed by one facet or by author. Each rail gets a
+        # partial index per sort order; facets and "my recipes" get composites that
+        # lead with the equality columns and end with the default sort.
+        indexes = [
+            models.Index(fields=['created_at', 'id'], condition=Q(featured=True), name='recipe_featured_created_idx'),
+            models.Index(fields=['calories', 'id'], condition=Q(featured=True), name='recipe_featured_cal_idx'),
+            models.Index(fields=['created_at', 'id'], condition=Q(featured=False), name='recipe_regular_created_idx'),
+            models.Index(fields=['calories', 'id'], condition=Q(featured=False), name='recipe_regular_cal_idx'),
+            models.Index(fields=['featured', 'cuisine', 'created_at'], name='recipe_cuisine_idx'),
+            models.Index(fields=['featured', 'food_type', 'created_at'], name='recipe_food_type_idx'),
+            models.Index(fields=['featured', 'difficulty', 'created_at'], name='recipe_difficulty_idx'),
+            models.Index(fields=['author', 'featured', 'created_at'], name='recipe_author_featured_idx'),
+        ]
+    
+    @property
+    def cover_image(self):
+        if hasattr(self, 'cover_images'):
+            return self.cover_images[0] if self.cover_images else None
+        return self.images.order_by('pk').first()
     
     def get_total_ingredients(self):
-        return self.ingredients.count()
+        return self.num_ingredients
     
     def is_featured_recipe(self):
         return self.featured
@@ -49,12 +134,31 @@ class Recipe(models.Model):
 class RecipeImage(models.Model):
     
     recipe = models.ForeignKey(Recipe, related_name='images', on_delete=models.CASCADE)
-    image = models.ImageField(upload_to='recipe_images/')
+    image = models.ImageField(upload_to='recipe_images/', storage=recipe_image_storage)
     uploaded_at = models.DateTimeField(auto_now_add = True)
     description = models.CharField(max_length=255, blank=True, null=True)
+    variants = models.JSONField(default=dict, blank=True, editable=False)
     
     def __str__(self):
         return f"Image for {self.recipe.title}"
+
+    def variant_url(self, variant, fmt='jpeg'):
+        """URL of a rendered variant, or of the original upload until it exists."""
+        name = self.variants.get(variant, {}).get('formats', {}).get(fmt)
+        return self.image.storage.url(name) if name else self.image.url
+
+    def srcset(self, fmt='jpeg', variants=None):
+        """A ``srcset`` value listing rendered variants in ``fmt`` by width; empty before rendering."""
+        renditions = sorted(
+            (rendition['width'], rendition['formats'][fmt])
+            for name, rendition in self.variants.items()
+            if (variants is None or name in variants) and fmt in rendition.get('formats', {})
+        )
+        return ', '.join(f'{self.image.storage.url(name)} {width}w' for width, name in renditions)
+
+    def resized_url(self, width, height):
+        """URL of this image scaled to fit one of the ``IMAGE_RESIZE_SIZES`` boxes on request."""
+        return reverse('resized_image', args=[width, height, self.image.name])
     
     
 class RecipeIngredient(models.Model):
@@ -78,16 +182,81 @@ class RecipeIngredient(models.Model):
         return f"{self.quantity} {self.get_unit_display()} of {self.name}"
     
     
-class RecipeCollection(models.Model):
+class RecipeCollectionQuerySet(models.QuerySet):
+
+    def for_detail(self):
+        """The owner joined in and the member recipes prefetched with their cover images."""
+        return self.select_related('user').prefetch_related(
+            models.Prefetch('recipes', queryset=Recipe.objects.with_cover_image())
+        )
+
+    def recount_recipes(self):
+        """Repair ``num_recipes`` in one UPDATE; returns how many rows had drifted."""
+        actual = _count_of(RecipeCollection.recipes.through.objects.all(), 'recipecollection')
+        return self.exclude(num_recipes=actual).update(num_recipes=actual)
+
+
+class RecipeCollection(CounterFieldsMixin, models.Model):
     
     title = models.CharField(max_length=255)
     user = models.ForeignKey(User, related_name='recipe_collections', on_delete=models.CASCADE)
     recipes = models.ManyToManyField(Recipe, related_name='collections')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
+    num_recipes = models.PositiveIntegerField(default=0, editable=False)
+    
+    objects = RecipeCollectionQuerySet.as_manager()
+    counter_fields = ('num_recipes',)
     
     def recipe_count(self):
-        return self.recipes.count()
+        return self.num_recipes
+
+    def __str__(self):
+        return f"{self.title} ({self.recipe_count()} recipes)"
+
+
+class ImageBlobQuerySet(models.QuerySet):
+
+    def retain(self, names):
+        """Count one more reference per occurrence of each stored file name."""
+        self._adjust(names, 1)
+
+    def release(self, names):
+        """Count one less reference per occurrence; blobs at zero are left for garbage collection."""
+        self._adjust(names, -1)
+
+    def _adjust(self, names, sign):
+        counts = Counter(name for name in names if name)
+        if not counts:
+            return
+        if sign > 0:
+            self.bulk_create([ImageBlob(name=name) for name in counts], ignore_conflicts=True)
+        by_count = {}
+        for name, count in counts.items():
+            by_count.setdefault(count, []).append(name)
+        for count, group in by_count.items():
+            self.filter(name__in=group).update(
+                references=Greatest(F('references') + sign * count, 0), updated_at=timezone.now()
+            )
+
+    def recount(self):
+        """Repair ``references`` from the ``RecipeImage`` rows in one UPDATE; returns how many had drifted."""
+        actual = _count_of(RecipeImage.objects.all(), 'image', outer='name')
+        return self.exclude(references=actual).update(references=actual, updated_at=timezone.now())
+
+    def unreferenced(self):
+        return self.filter(references=0)
+
+
+class ImageBlob(models.Model):
+    """A stored image file and how many ``RecipeImage`` rows point at it."""
+
+    name = models.CharField(max_length=255, unique=True)
+    references = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ImageBlobQuerySet.as_manager()
 
     def __str__(self):
-        return f"{self.title} ({self.recipe_count()} recipes)"
\ No newline at end of file
+        return f"{self.name} ({self.references} references)"
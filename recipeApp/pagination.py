@@ -0,0 +1,129 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+class KeysetPage:
+
+    def __init__(self, object_list, has_next, has_previous, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+
+class KeysetPaginator:
+    """
+    Pages through a queryset by seeking past the last row seen instead of
+    using OFFSET, so every page costs the same and no COUNT(*) is needed.
+
+    The queryset must be ordered by a single field named in ``keys``; the
+    primary key is appended as a tie-breaker. It may be a ``.values()``
+    queryset if the rows include that field and ``pk``. Cursors are opaque tokens that
+    encode the boundary row and the direction to read in.
+    """
+
+    keys = ('created_at', 'calories')
+
+    def __init__(self, queryset, per_page, keys=None):
+        if keys is not None:
+            self.keys = keys
+        if not self.supports(queryset, self.keys):
+            raise ValueError(f"Cannot keyset-paginate a queryset ordered by {queryset.query.order_by!r}.")
+        ordering = queryset.query.order_by[0]
+        self.queryset = queryset
+        self.per_page = int(per_page)
+        self.field_name = ordering.lstrip('-')
+        self.descending = ordering.startswith('-')
+        self.field = queryset.model._meta.get_field(self.field_name)
+
+    @classmethod
+    def supports(cls, queryset, keys=None):
+        ordering = queryset.query.order_by
+        return len(ordering) == 1 and ordering[0].lstrip('-') in (keys or cls.keys)
+
+    def encode_cursor(self, row, direction):
+        if isinstance(row, dict):
+            # A ``.values()`` row, which must include the ordering field and ``pk``.
+            value, pk = row[self.field_name], row['pk']
+        else:
+            value, pk = getattr(row, self.field_name), row.pk
+        if hasattr(value, 'isoformat'):
+            value = value.isoformat()
+        raw = json.dumps([direction, value, pk], separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+            direction, value, pk = json.loads(raw)
+            if direction not in ('n', 'p'):
+                raise ValueError(direction)
+            return direction, self.field.to_python(value), int(pk)
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            raise InvalidCursor(cursor)
+
+    def get_page(self, cursor=None):
+        """Return the page after (or before) ``cursor``; bad cursors yield the first page."""
+        direction, value, pk = 'n', None, None
+        if cursor:
+            try:
+                direction, value, pk = self.decode_cursor(cursor)
+            except InvalidCursor:
+                direction, value, pk = 'n', None, None
+
+        forward = direction == 'n'
+        # Reading backwards walks the ordering in reverse and flips the rows afterwards.
+        descending = self.descending if forward else not self.descending
+        prefix = '-' if descending else ''
+        queryset = self.queryset.order_by(f'{prefix}{self.field_name}', f'{prefix}pk')
+        if pk is not None:
+            lookup = 'lt' if descending else 'gt'
+            queryset = queryset.filter(
+                Q(**{f'{self.field_name}__{lookup}': value}) |
+                Q(**{self.field_name: value, f'pk__{lookup}': pk})
+            )
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if forward:
+            has_next, has_previous = has_more, pk is not None
+        else:
+            rows.reverse()
+            has_next, has_previous = True, has_more
+
+        return KeysetPage(
+            rows,
+            has_next=has_next and bool(rows),
+            has_previous=has_previous and bool(rows),
+            next_cursor=self.encode_cursor(rows[-1], 'n') if has_next and rows else None,
+            previous_cursor=self.encode_cursor(rows[0], 'p') if has_previous and rows else None,
+        )
+
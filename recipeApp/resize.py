@@ -0,0 +1,131 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+
+from .variants import render_variants
+
+
+class ResizeCache:
+    """
+    Recipe images resized on demand, kept as files under ``root`` and trimmed
+    back to ``max_bytes`` least-recently-used first. A hit sets the file's
+    atime, which is what eviction orders by, so the cache needs no index of its
+    own and survives restarts; the mtime stays the render time and serves as
+    ``Last-Modified``. Concurrent requests for the same rendition in
+    one process wait on a shared lock and the first one renders it; renders
+    write beside the target and rename, so other processes never read half a
+    file and at worst render the same rendition twice.
+    """
+
+    # Evicting down to this share of the limit keeps every write after the
+    # limit is reached from triggering another scan.
+    low_water = 0.9
+
+    def __init__(self, root, max_bytes):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._locks = {}
+        self._locks_lock = threading.Lock()
+        self._size = None
+
+    def path(self, name, width, height):
+        return os.path.join(self.root, f'{width}x{height}', os.path.splitext(name)[0] + '.jpg')
+
+    def open(self, source_path, name, width, height):
+        """
+        ``name`` resized to fit ``width`` x ``height`` as an open binary file,
+        rendering it on the first request. The file stays readable even if it
+        is evicted while being served.
+        """
+        path = self.path(name, width, height)
+        while True:
+            if not self._touch(path):
+                with self._lock(path):
+                    if not self._touch(path):
+                        render_variants(source_path, [(path, width, height, False, {'jpeg': path})])
+                        self._added(os.path.getsize(path), keep=path)
+            try:
+                return open(path, 'rb')
+            except FileNotFoundError:
+                # Evicted between the check and the open; render it again.
+                continue
+
+    def _touch(self, path):
+        try:
+            os.utime(path, ns=(time.time_ns(), os.stat(path).st_mtime_ns))
+        except FileNotFoundError:
+            return False
+        return True
+
+    @contextmanager
+    def _lock(self, path):
+        with self._locks_lock:
+            entry = self._locks.setdefault(path, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._locks_lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._locks[path]
+
+    def _added(self, written, keep=None):
+        with self._locks_lock:
+            if self._size is None:
+                self._size = sum(size for _, size, _ in self._entries())
+            else:
+                self._size += written
+            over = self._size > self.max_bytes
+        if over:
+            self.evict(keep)
+
+    def _entries(self):
+        stack = [self.root]
+        while stack:
+            with os.scandir(stack.pop()) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.name.endswith('.jpg'):
+                        stat = entry.stat(follow_symlinks=False)
+                        yield entry.path, stat.st_size, stat.st_atime
+
+    def evict(self, keep=None):
+        """Delete least recently used renditions, except ``keep``, until the cache is under its low-water mark."""
+        entries = sorted(self._entries(), key=lambda entry: entry[2])
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * self.low_water
+        for path, size, _ in entries:
+            if total <= target:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        with self._locks_lock:
+            self._size = total
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_resize_cache():
+    global _cache
+    with _cache_lock:
+        root, max_bytes = settings.IMAGE_RESIZE_CACHE_DIR, settings.IMAGE_RESIZE_CACHE_BYTES
+        if _cache is None or (_cache.root, _cache.max_bytes) != (root, max_bytes):
+            _cache = ResizeCache(root, max_bytes)
+        return _cache
+
+
+def allowed_size(width, height):
+    return f'{width}x{height}' in settings.IMAGE_RESIZE_SIZES
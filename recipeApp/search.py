@@ -0,0 +1,196 @@
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from django.utils.module_loading import import_string
+
+from .models import Recipe, RecipeIngredient
+
+
+SEARCH_TABLE = 'recipeApp_recipe_search'
+
+
+def get_search_backend():
+    """
+    Return the search backend for the default database. ``RECIPE_SEARCH_BACKEND``
+    may name a backend class explicitly; otherwise it is chosen by vendor.
+    """
+    path = getattr(settings, 'RECIPE_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)()
+    if connection.vendor == 'sqlite':
+        return SQLiteSearchBackend()
+    if connection.vendor == 'postgresql':
+        return PostgresSearchBackend()
+    return DatabaseSearchBackend()
+
+
+def search_terms(value):
+    """Split a query into the word tokens both FTS5 and tsvector index."""
+    return re.findall(r'[^\W_]+', value.lower())
+
+
+def build_documents(recipe_ids):
+    """Yield ``(recipe_id, title, author, cuisine, ingredients)`` for every indexed field."""
+    ingredients = defaultdict(list)
+    for recipe_id, name in RecipeIngredient.objects.filter(recipe_id__in=recipe_ids).values_list('recipe_id', 'name'):
+        ingredients[recipe_id].append(name)
+    rows = Recipe.objects.filter(pk__in=recipe_ids).values_list('pk', 'title', 'author__username', 'cuisine')
+    for pk, title, author, cuisine in rows:
+        yield pk, title, author, Recipe.CuisineType(cuisine).label, ' '.join(ingredients[pk])
+
+
+class DatabaseSearchBackend:
+    """Unindexed fallback that matches with ``icontains`` on every field."""
+
+    def match(self, value):
+        """A ``Q`` on ``Recipe`` selecting every recipe that matches ``value``."""
+        cuisines = [k for k, label in Recipe.CuisineType.choices if value.lower() in label.lower()]
+        return Q(pk__in=Recipe.objects.filter(
+            Q(title__icontains=value) |
+            Q(author__username__icontains=value) |
+            Q(cuisine__in=cuisines) |
+            Q(ingredients__name__icontains=value)
+        ).values('pk'))
+
+    def search(self, queryset, value):
+        """Filter a ``Recipe`` queryset down to matches, most relevant first."""
+        return queryset.filter(self.match(value))
+
+    def index_recipes(self, recipe_ids):
+        pass
+
+    def remove_recipes(self, recipe_ids):
+        pass
+
+    def rebuild(self):
+        pass
+
+
+class SQLiteSearchBackend(DatabaseSearchBackend):
+    """FTS5 table keyed by recipe id (its rowid), ranked with bm25."""
+
+    # bm25 column weights: title, author, cuisine, ingredients.
+    rank_sql = (
+        f'SELECT bm25("{SEARCH_TABLE}", 10.0, 2.0, 2.0, 1.0) FROM "{SEARCH_TABLE}" '
+        f'WHERE "{SEARCH_TABLE}" MATCH %s AND rowid = "recipeApp_recipe"."id"'
+    )
+
+    def query(self, value):
+        return ' '.join(f'"{term}"*' for term in search_terms(value))
+
+    def match(self, value):
+        query = self.query(value)
+        if not query:
+            return Q(pk__in=[])
+        return Q(pk__in=RawSQL(f'SELECT rowid FROM "{SEARCH_TABLE}" WHERE "{SEARCH_TABLE}" MATCH %s', [query]))
+
+    def search(self, queryset, value):
+        query = self.query(value)
+        if not query:
+            return queryset.none()
+        return queryset.filter(self.match(value)).annotate(
+            search_rank=RawSQL(self.rank_sql, [query])
+        ).order_by('search_rank', '-created_at')
+
+    def index_recipes(self, recipe_ids):
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+        with connection.cursor() as cursor:
+            self._delete(cursor, recipe_ids)
+            cursor.executemany(
+                f'INSERT INTO "{SEARCH_TABLE}" (rowid, title, author, cuisine, ingredients) VALUES (%s, %s, %s, %s, %s)',
+                list(build_documents(recipe_ids)),
+            )
+
+    def remove_recipes(self, recipe_ids):
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+        with connection.cursor() as cursor:
+            self._delete(cursor, recipe_ids)
+
+    def _delete(self, cursor, recipe_ids):
+        placeholders = ', '.join(['%s'] * len(recipe_ids))
+        cursor.execute(f'DELETE FROM "{SEARCH_TABLE}" WHERE rowid IN ({placeholders})', recipe_ids)
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM "{SEARCH_TABLE}"')
+        for batch in _batched(Recipe.objects.values_list('pk', flat=True).iterator(), 500):
+            self.index_recipes(batch)
+
+
+class PostgresSearchBackend(DatabaseSearchBackend):
+    """A weighted ``tsvector`` per recipe behind a GIN index, ranked with ts_rank."""
+
+    document_sql = (
+        "setweight(to_tsvector('simple', %s), 'A') || setweight(to_tsvector('simple', %s), 'B') || "
+        "setweight(to_tsvector('simple', %s), 'B') || setweight(to_tsvector('simple', %s), 'C')"
+    )
+    rank_sql = (
+        f'SELECT ts_rank(document, to_tsquery(\'simple\', %s)) FROM "{SEARCH_TABLE}" '
+        f'WHERE recipe_id = "recipeApp_recipe"."id"'
+    )
+
+    def query(self, value):
+        return ' & '.join(f'{term}:*' for term in search_terms(value))
+
+    def match(self, value):
+        query = self.query(value)
+        if not query:
+            return Q(pk__in=[])
+        return Q(pk__in=RawSQL(
+            f'SELECT recipe_id FROM "{SEARCH_TABLE}" WHERE document @@ to_tsquery(\'simple\', %s)', [query]
+        ))
+
+    def search(self, queryset, value):
+        query = self.query(value)
+        if not query:
+            return queryset.none()
+        return queryset.filter(self.match(value)).annotate(
+            search_rank=RawSQL(self.rank_sql, [query])
+        ).order_by('-search_rank', '-created_at')
+
+    def index_recipes(self, recipe_ids):
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+        documents = list(build_documents(recipe_ids))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f'INSERT INTO "{SEARCH_TABLE}" (recipe_id, document) VALUES (%s, {self.document_sql}) '
+                f'ON CONFLICT (recipe_id) DO UPDATE SET document = EXCLUDED.document',
+                documents,
+            )
+            stale = set(recipe_ids) - {document[0] for document in documents}
+            if stale:
+                cursor.execute(f'DELETE FROM "{SEARCH_TABLE}" WHERE recipe_id = ANY(%s)', [list(stale)])
+
+    def remove_recipes(self, recipe_ids):
+        recipe_ids = list(recipe_ids)
+        if not recipe_ids:
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM "{SEARCH_TABLE}" WHERE recipe_id = ANY(%s)', [recipe_ids])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'TRUNCATE "{SEARCH_TABLE}"')
+        for batch in _batched(Recipe.objects.values_list('pk', flat=True).iterator(), 500):
+            self.index_recipes(batch)
+
+
+def _batched(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
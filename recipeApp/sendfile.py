@@ -0,0 +1,120 @@
+"""
+Responses for files on disk that let the front server do the copying. Django
+decides whether and what to serve; with ``MEDIA_SENDFILE = 'nginx'`` it then
+answers with an ``X-Accel-Redirect`` to an internal location, with
+``'sendfile'`` (Apache mod_xsendfile, lighttpd) with an ``X-Sendfile`` path,
+and otherwise streams the file itself, honouring ``Range`` and
+``If-Modified-Since``.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils.http import http_date
+from django.views.static import was_modified_since
+
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def send_file(request, file, content_type=None):
+    """
+    Respond with ``file``, an open binary file whose ``name`` is its absolute
+    path. The response owns the file and closes it.
+    """
+    stat = os.fstat(file.fileno())
+    content_type = content_type or mimetypes.guess_type(file.name)[0] or 'application/octet-stream'
+
+    if not was_modified_since(request.META.get('HTTP_IF_MODIFIED_SINCE'), stat.st_mtime):
+        file.close()
+        response = HttpResponseNotModified()
+    else:
+        response = _offloaded(file, content_type) or _streamed(request, file, stat.st_size, content_type)
+    response['Last-Modified'] = http_date(stat.st_mtime)
+    return response
+
+
+def _offloaded(file, content_type):
+    backend = getattr(settings, 'MEDIA_SENDFILE', '')
+    if backend == 'sendfile':
+        header, value = 'X-Sendfile', file.name
+    elif backend == 'nginx':
+        location = _internal_location(file.name)
+        if location is None:
+            return None
+        header, value = 'X-Accel-Redirect', location
+    else:
+        return None
+    file.close()
+    response = HttpResponse(content_type=content_type)
+    response[header] = value
+    return response
+
+
+def _internal_location(path):
+    """The nginx ``internal`` URL for ``path`` from ``MEDIA_SENDFILE_LOCATIONS``, or None outside them."""
+    path = os.path.realpath(path)
+    for root, location in settings.MEDIA_SENDFILE_LOCATIONS.items():
+        root = os.path.realpath(root)
+        if os.path.commonpath([root, path]) == root:
+            relative = os.path.relpath(path, root).replace(os.sep, '/')
+            return location.rstrip('/') + '/' + quote(relative)
+    return None
+
+
+def _streamed(request, file, size, content_type):
+    byte_range = _parse_range(request.META.get('HTTP_RANGE'), size)
+    if byte_range is None:
+        response = FileResponse(file, content_type=content_type)
+    elif byte_range is False:
+        file.close()
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    else:
+        start, end = byte_range
+        file.seek(start)
+        response = StreamingHttpResponse(_read(file, end - start + 1), status=206, content_type=content_type)
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        # Closed with the response, as FileResponse does with its file.
+        response._resource_closers.append(file.close)
+    response['Accept-Ranges'] = 'bytes'
+    return response
+
+
+def _parse_range(header, size):
+    """
+    ``(start, end)`` inclusive for a single satisfiable byte range, False for
+    an unsatisfiable one and None to send the whole file. Multiple ranges are
+    answered with the whole file, which RFC 9110 allows.
+    """
+    match = RANGE_RE.match(header or '')
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first:
+        if not last:
+            return None
+        suffix = int(last)
+        if not suffix:
+            return False
+        return max(size - suffix, 0), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        return False
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+def _read(file, remaining):
+    while remaining > 0:
+        chunk = file.read(min(CHUNK_SIZE, remaining))
+        if not chunk:
+            break
+        remaining -= len(chunk)
+        yield chunk
@@ -0,0 +1,217 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_init, post_save, pre_delete
+from django.dispatch import Signal, receiver
+from django.utils import timezone
+
+from .autocomplete import loaded_ingredient_index
+from .cache import bump_catalogue_version, bump_page_version
+from .images import refresh_variants
+from .models import ImageBlob, Recipe, RecipeCollection, RecipeImage, RecipeIngredient
+from .search import get_search_backend
+
+
+# Sent by ``writes.save_recipe`` once the recipe's ingredient and image rows are
+# written in bulk, which sends no post_save/post_delete for them.
+recipe_contents_saved = Signal()
+
+
+@receiver(post_save, sender=Recipe)
+def index_saved_recipe(sender, instance, **kwargs):
+    get_search_backend().index_recipes([instance.pk])
+
+
+@receiver(post_delete, sender=Recipe)
+def unindex_deleted_recipe(sender, instance, **kwargs):
+    get_search_backend().remove_recipes([instance.pk])
+
+
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def reindex_ingredient_recipe(sender, instance, **kwargs):
+    get_search_backend().index_recipes([instance.recipe_id])
+
+
+@receiver(post_init, sender=RecipeIngredient)
+def remember_loaded_ingredient(sender, instance, **kwargs):
+    instance._loaded_name = instance.name
+    instance._loaded_recipe_id = instance.recipe_id
+
+
+def _update_ingredient_suggestions(added_names=(), removed_names=()):
+    # The index is shared by every request, so it only hears about committed rows.
+    def update():
+        index = loaded_ingredient_index()
+        if index is not None:
+            for name in removed_names:
+                index.remove(name)
+            for name in added_names:
+                index.add(name)
+    transaction.on_commit(update)
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def add_ingredient_suggestion(sender, instance, created, **kwargs):
+    if created:
+        _update_ingredient_suggestions(added_names=[instance.name])
+    elif instance._loaded_name != instance.name:
+        _update_ingredient_suggestions(added_names=[instance.name], removed_names=[instance._loaded_name])
+    instance._loaded_name = instance.name
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def remove_ingredient_suggestion(sender, instance, **kwargs):
+    _update_ingredient_suggestions(removed_names=[instance._loaded_name])
+
+
+def _adjust_ingredient_count(ingredient, recipe_id, delta):
+    Recipe.objects.filter(pk=recipe_id).update(num_ingredients=F('num_ingredients') + delta)
+    if RecipeIngredient.recipe.is_cached(ingredient) and ingredient.recipe.pk == recipe_id:
+        ingredient.recipe.num_ingredients += delta
+
+
+@receiver(post_save, sender=RecipeIngredient)
+def count_saved_ingredient(sender, instance, created, **kwargs):
+    if created:
+        _adjust_ingredient_count(instance, instance.recipe_id, 1)
+    elif instance._loaded_recipe_id != instance.recipe_id:
+        _adjust_ingredient_count(instance, instance._loaded_recipe_id, -1)
+        _adjust_ingredient_count(instance, instance.recipe_id, 1)
+    instance._loaded_recipe_id = instance.recipe_id
+
+
+@receiver(post_delete, sender=RecipeIngredient)
+def count_deleted_ingredient(sender, instance, **kwargs):
+    _adjust_ingredient_count(instance, instance.recipe_id, -1)
+
+
+@receiver(pre_delete, sender=Recipe)
+def uncount_deleted_recipe(sender, instance, **kwargs):
+    # The cascade removes membership rows without sending m2m_changed.
+    RecipeCollection.objects.filter(recipes=instance).update(
+        num_recipes=F('num_recipes') - 1, updated_at=timezone.now()
+    )
+
+
+@receiver(m2m_changed, sender=RecipeCollection.recipes.through)
+def count_collection_recipes(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # ``instance`` is a Recipe and ``pk_set`` holds collection ids.
+        if action == 'pre_clear':
+            instance._cleared_collection_ids = list(instance.collections.values_list('pk', flat=True))
+        elif action == 'post_add':
+            RecipeCollection.objects.filter(pk__in=pk_set).update(num_recipes=F('num_recipes') + 1)
+        elif action == 'post_remove':
+            RecipeCollection.objects.filter(pk__in=pk_set).recount_recipes()
+        elif action == 'post_clear':
+            RecipeCollection.objects.filter(pk__in=instance._cleared_collection_ids).recount_recipes()
+        return
+
+    if action == 'post_add':
+        # Django only reports the ids that were actually inserted.
+        RecipeCollection.objects.filter(pk=instance.pk).update(num_recipes=F('num_recipes') + len(pk_set))
+        instance.num_recipes += len(pk_set)
+    elif action in ('post_remove', 'post_clear'):
+        # ``pk_set`` may name recipes that were never members, so recount instead of subtracting.
+        RecipeCollection.objects.filter(pk=instance.pk).recount_recipes()
+        instance.refresh_from_db(fields=['num_recipes'])
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def invalidate_catalogue(sender, **kwargs):
+    bump_catalogue_version()
+
+
+@receiver(post_save, sender=RecipeImage)
+@receiver(post_delete, sender=RecipeImage)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+def touch_recipe(sender, instance, **kwargs):
+    # Rendered cards and detail page validators are keyed on updated_at, so a
+    # change to a recipe's images or ingredients is a change to the recipe.
+    now = timezone.now()
+    Recipe.objects.filter(pk=instance.recipe_id).update(updated_at=now)
+    if sender.recipe.is_cached(instance) and instance.recipe.pk == instance.recipe_id:
+        instance.recipe.updated_at = now
+
+
+@receiver(m2m_changed, sender=RecipeCollection.recipes.through)
+def touch_collections(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        collections = RecipeCollection.objects.filter(pk=instance.pk)
+    elif action == 'post_clear':
+        collections = RecipeCollection.objects.filter(pk__in=instance._cleared_collection_ids)
+    else:
+        collections = RecipeCollection.objects.filter(pk__in=pk_set)
+    collections.update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=RecipeImage)
+@receiver(post_delete, sender=RecipeImage)
+@receiver(post_save, sender=RecipeIngredient)
+@receiver(post_delete, sender=RecipeIngredient)
+@receiver(post_save, sender=RecipeCollection)
+@receiver(post_delete, sender=RecipeCollection)
+def invalidate_pages(sender, **kwargs):
+    bump_page_version()
+
+
+@receiver(recipe_contents_saved)
+def recount_saved_recipe(sender, recipe, **kwargs):
+    Recipe.objects.filter(pk=recipe.pk).recount_ingredients()
+    recipe.refresh_from_db(fields=['num_ingredients'])
+
+
+@receiver(recipe_contents_saved)
+def reindex_saved_recipe(sender, recipe, **kwargs):
+    get_search_backend().index_recipes([recipe.pk])
+
+
+@receiver(recipe_contents_saved)
+def update_saved_recipe_suggestions(sender, added_names, removed_names, **kwargs):
+    _update_ingredient_suggestions(added_names, removed_names)
+
+
+@receiver(recipe_contents_saved)
+def invalidate_saved_recipe(sender, **kwargs):
+    # Bumped again after commit so nothing cached from the old rows mid-transaction survives.
+    transaction.on_commit(bump_catalogue_version)
+    transaction.on_commit(bump_page_version)
+
+
+@receiver(post_init, sender=RecipeImage)
+def remember_loaded_image(sender, instance, **kwargs):
+    instance._loaded_image_name = instance.image.name if instance.image else None
+
+
+def _image_files_saved(images):
+    changed = [image for image in images if image.image and image.image.name != image._loaded_image_name]
+    if not changed:
+        return
+    ImageBlob.objects.retain(image.image.name for image in changed)
+    ImageBlob.objects.release(image._loaded_image_name for image in changed)
+    refresh_variants(changed)
+    for image in changed:
+        image._loaded_image_name = image.image.name
+
+
+@receiver(post_save, sender=RecipeImage)
+def image_file_saved(sender, instance, **kwargs):
+    _image_files_saved([instance])
+
+
+@receiver(recipe_contents_saved)
+def recipe_image_files_saved(sender, images=(), **kwargs):
+    _image_files_saved(images)
+
+
+@receiver(post_delete, sender=RecipeImage)
+def release_image_file(sender, instance, **kwargs):
+    ImageBlob.objects.release([instance._loaded_image_name])
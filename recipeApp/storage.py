@@ -0,0 +1,62 @@
+import hashlib
+import os
+import posixpath
+import tempfile
+
+from django.core.files.storage import FileSystemStorage
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    """
+    Keeps each distinct file once, named after the SHA-256 of its bytes:
+    ``<upload dir>/<first two hex digits>/<digest><extension>``. The digest is
+    taken while the upload streams to a temporary file, and saving bytes that
+    are already stored returns the existing name without writing a second copy.
+    """
+
+    chunk_size = 64 * 1024
+
+    def get_available_name(self, name, max_length=None):
+        # The stored name is only known once the content is hashed in _save;
+        # identical content is meant to land on the same name.
+        return name
+
+    def _save(self, name, content):
+        directory, basename = posixpath.split(name)
+        extension = os.path.splitext(basename)[1].lower()
+        os.makedirs(self.path(directory), mode=self.directory_permissions_mode or 0o777, exist_ok=True)
+
+        digest = hashlib.sha256()
+        fd, partial = tempfile.mkstemp(dir=self.path(directory), suffix='.part')
+        try:
+            with os.fdopen(fd, 'wb') as destination:
+                for chunk in content.chunks(self.chunk_size):
+                    digest.update(chunk)
+                    destination.write(chunk)
+
+            hexdigest = digest.hexdigest()
+            stored_name = posixpath.join(directory, hexdigest[:2], hexdigest + extension)
+            stored_path = self.path(stored_name)
+            if os.path.exists(stored_path):
+                os.remove(partial)
+                # Reusing a file counts as a fresh write, so the orphaned
+                # media collector's grace period covers this upload too.
+                os.utime(stored_path)
+            else:
+                os.makedirs(os.path.dirname(stored_path), mode=self.directory_permissions_mode or 0o777, exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(partial, self.file_permissions_mode)
+                os.replace(partial, stored_path)
+        except BaseException:
+            if os.path.exists(partial):
+                os.remove(partial)
+            raise
+        return stored_name
+
+
+_image_storage = ContentAddressedStorage()
+
+
+def recipe_image_storage():
+    """``RecipeImage.image`` storage; a callable so migrations do not serialise the instance."""
+    return _image_storage
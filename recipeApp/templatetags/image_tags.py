@@ -0,0 +1,15 @@
+from django import template
+
+register = template.Library()
+
+@register.inclusion_tag('includes/recipe_image.html')
+def recipe_image(image, variant, sizes, alt='', css_class=''):
+    """A <picture> for one variant slot, with WebP and JPEG sources once the variants exist."""
+    return {
+        'src': image.variant_url(variant) if image else '',
+        'webp_srcset': image.srcset('webp', [variant]) if image else '',
+        'jpeg_srcset': image.srcset('jpeg', [variant]) if image else '',
+        'sizes': sizes,
+        'alt': alt,
+        'css_class': css_class,
+    }
@@ -1,12 +1,45 @@
+import csv
+import json
+import multiprocessing
 import os
-from django.test import TestCase
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO, StringIO
+from PIL import Image as PILImage
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
+from .cache import CATALOGUE_VERSION_KEY
+from django.test import SimpleTestCase, TestCase
 from django.contrib.auth.models import User
-from .models import Recipe, RecipeIngredient, RecipeCollection, RecipeImage
+from .models import ImageBlob, ImageBlobQuerySet, Recipe, RecipeIngredient, RecipeCollection, RecipeImage
 from .forms import RecipeCollectionForm, RecipeForm, RecipeIngredientForm
 from datetime import timedelta
+from django.utils import timezone
 from django.urls import reverse
+from django.utils.http import http_date
 from django.core.files.uploadedfile import SimpleUploadedFile
 from .filters import RecipeFilter, RecipeCollectionFilter
+from .views import RecipeListView
+from .search import get_search_backend
+from .autocomplete import PrefixIndex, get_ingredient_index, reset_ingredient_index
+from unittest.mock import patch
+from django.db import connection, transaction
+from django.test import override_settings
+from django.test.utils import CaptureQueriesContext
+from django.test import RequestFactory
+from django.contrib.auth.models import AnonymousUser
+from django.template import RequestContext, Template
+from django.http import HttpResponse
+from .decorators import anonymous_page_cache
+from .images import variant_targets
+from .variants import render_variants
+from .exports import recipe_rows
+from .management.commands.import_recipes import Command as ImportRecipesCommand
+from .archives import collection_archive
+import zipfile
+from .resize import ResizeCache, get_resize_cache
+import threading
+import time
 
 
 class RecipeModelTest(TestCase):
@@ -83,6 +116,853 @@ class RecipeImageModelTest(TestCase):
         self.assertEqual(str(self.recipe.title), 'Test Recipe')
         
         
+@override_settings(IMAGE_VARIANT_WORKERS=0)
+class RecipeImageVariantTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        user = User.objects.create_user(username='testuser', password='password')
+        self.recipe = Recipe.objects.create(
+            author=user, title='Photo Recipe', servings=2, prepration_time=timedelta(minutes=10),
+            total_time=timedelta(minutes=20), calories=100, instructions='Instructions.',
+            cuisine=Recipe.CuisineType.CHINESE, food_type=Recipe.FoodType.VEGAN, difficulty=Recipe.DifficultyLevel.EASY
+        )
+
+    def upload(self, name='photo.jpg', size=(1000, 600), color='orange'):
+        buffer = BytesIO()
+        PILImage.new('RGB', size, color).save(buffer, 'JPEG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+    def test_variants_are_rendered_after_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = RecipeImage.objects.create(recipe=self.recipe, image=self.upload())
+        self.assertEqual(image.variant_url('card'), image.image.url)
+
+        image.refresh_from_db()
+        stem = os.path.splitext(image.image.name)[0]
+        self.assertEqual(image.variants['card'], {
+            'width': 800, 'height': 384,
+            'formats': {'webp': f'variants/{stem}/card.webp', 'jpeg': f'variants/{stem}/card.jpg'},
+        })
+        self.assertEqual((image.variants['tile']['width'], image.variants['tile']['height']), (256, 256))
+        self.assertEqual((image.variants['detail']['width'], image.variants['detail']['height']), (1000, 600))
+        self.assertEqual(image.variant_url('tile', 'webp'), f'/media/variants/{stem}/tile.webp')
+        self.assertEqual(image.srcset('jpeg', ['card']), f'/media/variants/{stem}/card.jpg 800w')
+        with PILImage.open(image.image.storage.path(f'variants/{stem}/card.webp')) as card:
+            self.assertEqual(card.size, (800, 384))
+
+        response = self.client.get(reverse('recipe_list'))
+        self.assertContains(response, f'srcset="/media/variants/{stem}/card.webp 800w"')
+
+    def test_replacing_the_file_forgets_old_variants(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = RecipeImage.objects.create(recipe=self.recipe, image=self.upload())
+        image.refresh_from_db()
+        self.assertTrue(image.variants)
+
+        image.image = self.upload('other.jpg', color='green')
+        with self.captureOnCommitCallbacks() as callbacks:
+            image.save()
+        image.refresh_from_db()
+        self.assertEqual(image.variants, {})
+        self.assertEqual(len(callbacks), 1)
+
+    def test_workers_need_no_django(self):
+        with self.captureOnCommitCallbacks():
+            image = RecipeImage.objects.create(recipe=self.recipe, image=self.upload())
+        targets, _ = variant_targets(image)
+        with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+            sizes = pool.submit(render_variants, image.image.path, targets).result()
+        self.assertEqual(sizes['card'], (800, 384))
+
+
+@override_settings(IMAGE_VARIANT_WORKERS=0)
+class ContentAddressedStorageTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = media.name
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        user = User.objects.create_user(username='testuser', password='password')
+        self.recipe = Recipe.objects.create(
+            author=user, title='Photo Recipe', servings=2, prepration_time=timedelta(minutes=10),
+            total_time=timedelta(minutes=20), calories=100, instructions='Instructions.',
+            cuisine=Recipe.CuisineType.CHINESE, food_type=Recipe.FoodType.VEGAN, difficulty=Recipe.DifficultyLevel.EASY
+        )
+
+    def upload(self, name='photo.JPG', color='orange'):
+        buffer = BytesIO()
+        PILImage.new('RGB', (64, 64), color).save(buffer, 'JPEG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/jpeg')
+
+    def stored_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.media)
+            for root, _, names in os.walk(os.path.join(self.media, 'recipe_images')) for name in names
+        )
+
+    def test_identical_uploads_share_one_file(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = RecipeImage.objects.create(recipe=self.recipe, image=self.upload('a.JPG'))
+            second = RecipeImage.objects.create(recipe=self.recipe, image=self.upload('b.jpg'))
+
+        self.assertEqual(first.image.name, second.image.name)
+        self.assertRegex(first.image.name, r'^recipe_images/([0-9a-f]{2})/\1[0-9a-f]{62}\.jpg$')
+        self.assertEqual(self.stored_files(), [first.image.name])
+        self.assertEqual(ImageBlob.objects.get().references, 2)
+
+    def test_references_follow_saves_and_deletes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = RecipeImage.objects.create(recipe=self.recipe, image=self.upload())
+            other = RecipeImage.objects.create(recipe=self.recipe, image=self.upload(color='green'))
+        old_name = image.image.name
+
+        image.image = self.upload(color='green')
+        with self.captureOnCommitCallbacks(execute=True):
+            image.save()
+        self.assertEqual(image.image.name, other.image.name)
+        self.assertEqual(ImageBlob.objects.get(name=old_name).references, 0)
+        self.assertEqual(ImageBlob.objects.get(name=image.image.name).references, 2)
+
+        other.delete()
+        self.assertEqual(ImageBlob.objects.get(name=image.image.name).references, 1)
+        self.assertEqual(list(ImageBlob.objects.unreferenced().values_list('name', flat=True)), [old_name])
+
+    def test_recount_repairs_drift(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            image = RecipeImage.objects.create(recipe=self.recipe, image=self.upload())
+        ImageBlob.objects.update(references=7)
+
+        self.assertEqual(ImageBlob.objects.recount(), 1)
+        self.assertEqual(ImageBlob.objects.get(name=image.image.name).references, 1)
+
+    def test_dedupe_command_merges_legacy_files(self):
+        buffer = BytesIO()
+        PILImage.new('RGB', (64, 64), 'orange').save(buffer, 'JPEG')
+        os.makedirs(os.path.join(self.media, 'recipe_images'))
+        for name in ('old.jpg', 'copy.jpg'):
+            with open(os.path.join(self.media, 'recipe_images', name), 'wb') as legacy:
+                legacy.write(buffer.getvalue())
+        with self.captureOnCommitCallbacks(execute=True):
+            RecipeImage.objects.bulk_create([
+                RecipeImage(recipe=self.recipe, image='recipe_images/old.jpg'),
+                RecipeImage(recipe=self.recipe, image='recipe_images/copy.jpg'),
+            ])
+
+        out = StringIO()
+        call_command('dedupe_recipe_images', '--dry-run', stdout=out)
+        self.assertIn('2 files would be renamed, 1 of them duplicates.', out.getvalue())
+        self.assertEqual(len(self.stored_files()), 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('dedupe_recipe_images', stdout=StringIO())
+        names = set(RecipeImage.objects.values_list('image', flat=True))
+        self.assertEqual(len(names), 1)
+        self.assertEqual(self.stored_files(), sorted(names))
+        self.assertEqual(ImageBlob.objects.get(name__in=names).references, 2)
+        self.assertTrue(all(image.variants for image in RecipeImage.objects.all()))
+
+
+@override_settings(IMAGE_VARIANT_WORKERS=0, IMAGE_RESIZE_SIZES={'320x240'})
+class ResizedImageViewTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(
+            MEDIA_ROOT=media.name, IMAGE_RESIZE_CACHE_DIR=os.path.join(media.name, 'resized')
+        ))
+        user = User.objects.create_user(username='testuser', password='password')
+        recipe = Recipe.objects.create(
+            author=user, title='Photo Recipe', servings=2, prepration_time=timedelta(minutes=10),
+            total_time=timedelta(minutes=20), calories=100, instructions='Instructions.',
+            cuisine=Recipe.CuisineType.CHINESE, food_type=Recipe.FoodType.VEGAN, difficulty=Recipe.DifficultyLevel.EASY
+        )
+        buffer = BytesIO()
+        PILImage.new('RGB', (1000, 600), 'orange').save(buffer, 'JPEG')
+        with self.captureOnCommitCallbacks():
+            self.image = RecipeImage.objects.create(
+                recipe=recipe, image=SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+            )
+
+    def test_resizes_to_fit_and_caches_for_good(self):
+        url = self.image.resized_url(320, 240)
+        self.assertEqual(url, f'/media/r/320x240/{self.image.image.name}')
+
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn('public', response['Cache-Control'])
+        with PILImage.open(BytesIO(b''.join(response.streaming_content))) as resized:
+            self.assertEqual(resized.size, (320, 192))
+
+        with patch('recipeApp.resize.render_variants') as render:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        render.assert_not_called()
+
+    def test_hits_keep_their_last_modified(self):
+        url = self.image.resized_url(320, 240)
+        self.client.get(url)
+        rendition = get_resize_cache().path(self.image.image.name, 320, 240)
+        os.utime(rendition, (0, 3600))
+        last_modified = http_date(3600)
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['Last-Modified'], last_modified)
+        self.assertEqual(self.client.head(url).status_code, 200)
+
+    def test_rejects_sizes_and_files_outside_the_whitelist(self):
+        self.assertEqual(self.client.get(self.image.resized_url(321, 240)).status_code, 404)
+        self.assertEqual(self.client.get('/media/r/320x240/recipe_images/missing.jpg').status_code, 404)
+        self.assertEqual(self.client.get('/media/r/320x240/../db.sqlite3').status_code, 404)
+
+
+class ResizeCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = directory.name
+        self.source = os.path.join(self.root, 'source.png')
+        PILImage.new('RGB', (400, 400), 'orange').save(self.source)
+
+    def get(self, cache, name):
+        with cache.open(self.source, name, 100, 100) as resized:
+            return resized.name
+
+    def test_evicts_least_recently_used(self):
+        cache = ResizeCache(os.path.join(self.root, 'cache'), max_bytes=10 ** 6)
+        first = self.get(cache, 'a.png')
+        second = self.get(cache, 'b.png')
+        os.utime(first, (0, 0))
+        os.utime(second, (1, 1))
+        self.get(cache, 'a.png')
+        self.assertEqual(os.path.getmtime(first), 0)
+        cache.max_bytes = os.path.getsize(first) + os.path.getsize(second) - 1
+        cache.evict()
+        self.assertTrue(os.path.exists(first))
+        self.assertFalse(os.path.exists(second))
+
+    def test_keeps_the_rendition_being_served(self):
+        cache = ResizeCache(os.path.join(self.root, 'cache'), max_bytes=1)
+        first = self.get(cache, 'a.png')
+        second = self.get(cache, 'b.png')
+        self.assertFalse(os.path.exists(first))
+        self.assertTrue(os.path.exists(second))
+
+    def test_concurrent_requests_render_once(self):
+        cache = ResizeCache(os.path.join(self.root, 'cache'), max_bytes=10 ** 6)
+        calls = []
+
+        def slow_render(*args):
+            calls.append(args)
+            time.sleep(0.05)
+            return render_variants(*args)
+
+        with patch('recipeApp.resize.render_variants', slow_render):
+            threads = [threading.Thread(target=self.get, args=(cache, 'a.png')) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(cache._locks, {})
+
+
+def signed_in_only(request, image):
+    return request.user.is_authenticated
+
+
+class MediaServingTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = media.name
+        self.enterContext(override_settings(MEDIA_ROOT=media.name, MEDIA_SENDFILE=''))
+        os.makedirs(os.path.join(media.name, 'recipe_images'))
+        self.path = os.path.join(media.name, 'recipe_images', 'photo.jpg')
+        with open(self.path, 'wb') as photo:
+            photo.write(bytes(range(100)))
+        user = User.objects.create_user(username='testuser', password='password')
+        self.recipe = Recipe.objects.create(
+            author=user, title='Photo Recipe', servings=2, prepration_time=timedelta(minutes=10),
+            total_time=timedelta(minutes=20), calories=100, instructions='Instructions.',
+            cuisine=Recipe.CuisineType.CHINESE, food_type=Recipe.FoodType.VEGAN, difficulty=Recipe.DifficultyLevel.EASY
+        )
+        RecipeImage.objects.create(recipe=self.recipe, image='recipe_images/photo.jpg')
+
+    def test_streams_the_whole_file(self):
+        response = self.client.get('/media/recipe_images/photo.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(100)))
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertIn('Last-Modified', response)
+
+        response = self.client.head('/media/recipe_images/photo.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Length'], '100')
+
+    def test_ranges(self):
+        response = self.client.get('/media/recipe_images/photo.jpg', HTTP_RANGE='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 10-19/100')
+        self.assertEqual(response['Content-Length'], '10')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(10, 20)))
+
+        response = self.client.get('/media/recipe_images/photo.jpg', HTTP_RANGE='bytes=-5')
+        self.assertEqual(b''.join(response.streaming_content), bytes(range(95, 100)))
+        response = self.client.get('/media/recipe_images/photo.jpg', HTTP_RANGE='bytes=90-')
+        self.assertEqual(response['Content-Range'], 'bytes 90-99/100')
+
+        response = self.client.get('/media/recipe_images/photo.jpg', HTTP_RANGE='bytes=100-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], 'bytes */100')
+
+        response = self.client.get('/media/recipe_images/photo.jpg', HTTP_RANGE='bytes=0-1,5-6')
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_modified_since(self):
+        last_modified = self.client.get('/media/recipe_images/photo.jpg')['Last-Modified']
+        response = self.client.get('/media/recipe_images/photo.jpg', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+        os.utime(self.path, (os.path.getmtime(self.path) + 60,) * 2)
+        response = self.client.get('/media/recipe_images/photo.jpg', HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 200)
+
+    def test_hands_off_to_the_front_server(self):
+        with override_settings(MEDIA_SENDFILE='nginx', MEDIA_SENDFILE_LOCATIONS={self.media: '/internal/media/'}):
+            response = self.client.get('/media/recipe_images/photo.jpg')
+        self.assertEqual(response['X-Accel-Redirect'], '/internal/media/recipe_images/photo.jpg')
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+
+        with override_settings(MEDIA_SENDFILE='sendfile'):
+            response = self.client.get('/media/recipe_images/photo.jpg')
+        self.assertEqual(response['X-Sendfile'], self.path)
+
+    def test_only_files_a_recipe_image_owns(self):
+        for name in ('recipe_images/stray.jpg', 'variants/recipe_images/photo/card.webp', 'variants/recipe_images/stray/card.webp'):
+            path = os.path.join(self.media, name)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as stray:
+                stray.write(b'stray')
+        self.assertEqual(self.client.get('/media/recipe_images/stray.jpg').status_code, 404)
+        self.assertEqual(self.client.get('/media/variants/recipe_images/stray/card.webp').status_code, 404)
+        self.assertEqual(self.client.get('/media/variants/recipe_images/photo/card.webp').status_code, 200)
+
+    @override_settings(MEDIA_ACCESS_CHECK='recipeApp.tests.signed_in_only')
+    def test_access_check(self):
+        response = self.client.get('/media/recipe_images/photo.jpg')
+        self.assertEqual(response.status_code, 403)
+        self.client.login(username='testuser', password='password')
+        response = self.client.get('/media/recipe_images/photo.jpg')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_only_finished_files_inside_media_root(self):
+        with open(self.path + '.part', 'wb'):
+            pass
+        for url in ('/media/recipe_images/photo.jpg.part', '/media/recipe_images/missing.jpg',
+                    '/media/recipe_images', '/media/../manage.py', '/media/%2e%2e/manage.py'):
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+
+
+@override_settings(IMAGE_VARIANT_WORKERS=0)
+class CollectOrphanedMediaTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.media = media.name
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        user = User.objects.create_user(username='testuser', password='password')
+        self.recipe = Recipe.objects.create(
+            author=user, title='Photo Recipe', servings=2, prepration_time=timedelta(minutes=10),
+            total_time=timedelta(minutes=20), calories=100, instructions='Instructions.',
+            cuisine=Recipe.CuisineType.CHINESE, food_type=Recipe.FoodType.VEGAN, difficulty=Recipe.DifficultyLevel.EASY
+        )
+        self.kept = self.create_image('orange')
+        self.deleted = self.create_image('green')
+        self.deleted_name = self.deleted.image.name
+        self.deleted.delete()
+        for root, _, names in os.walk(media.name):
+            for name in names:
+                os.utime(os.path.join(root, name), (0, 0))
+
+    def create_image(self, color):
+        buffer = BytesIO()
+        PILImage.new('RGB', (300, 300), color).save(buffer, 'JPEG')
+        upload = SimpleUploadedFile('photo.jpg', buffer.getvalue(), content_type='image/jpeg')
+        with self.captureOnCommitCallbacks(execute=True):
+            image = RecipeImage.objects.create(recipe=self.recipe, image=upload)
+        image.refresh_from_db()
+        return image
+
+    def files(self, root=None):
+        root = root or self.media
+        return sorted(
+            os.path.relpath(os.path.join(directory, name), root)
+            for directory, _, names in os.walk(root) for name in names
+        )
+
+    def test_dry_run_reports_without_touching_files(self):
+        before = self.files()
+        out = StringIO()
+        call_command('collect_orphaned_media', '--dry-run', '--verbosity', '2', stdout=out)
+        self.assertEqual(self.files(), before)
+        self.assertIn(self.deleted_name, out.getvalue())
+        self.assertIn('7 orphaned files', out.getvalue())
+
+    def test_deletes_orphans_and_their_directories(self):
+        stem = os.path.splitext(self.deleted_name)[0]
+        call_command('collect_orphaned_media', '--batch-size', '2', stdout=StringIO())
+
+        files = self.files()
+        self.assertIn(self.kept.image.name, files)
+        self.assertIn(self.kept.variants['card']['formats']['webp'], files)
+        self.assertNotIn(self.deleted_name, files)
+        self.assertFalse(any(name.startswith(f'variants/{stem}/') for name in files))
+        self.assertFalse(os.path.exists(os.path.join(self.media, 'variants', stem)))
+        self.assertFalse(ImageBlob.objects.filter(name=self.deleted_name).exists())
+        self.assertTrue(ImageBlob.objects.filter(name=self.kept.image.name).exists())
+
+    def test_grace_period_and_quarantine(self):
+        os.utime(os.path.join(self.media, self.deleted_name))
+        quarantine = tempfile.TemporaryDirectory()
+        self.addCleanup(quarantine.cleanup)
+        call_command('collect_orphaned_media', '--quarantine', quarantine.name, stdout=StringIO())
+
+        self.assertIn(self.deleted_name, self.files())
+        self.assertEqual(len(self.files(quarantine.name)), 6)
+        self.assertTrue(all(name.startswith('variants/') for name in self.files(quarantine.name)))
+
+
+    def test_collects_blobs_released_before_the_grace_period(self):
+        # A recent mtime alone would keep the file; the blob says when its last reference went.
+        os.utime(os.path.join(self.media, self.deleted_name))
+        ImageBlob.objects.filter(name=self.deleted_name).update(updated_at=timezone.now() - timedelta(days=2))
+        out = StringIO()
+        call_command('collect_orphaned_media', '--dry-run', stdout=out)
+        self.assertIn('7 orphaned files', out.getvalue())
+
+        call_command('collect_orphaned_media', stdout=StringIO())
+        stem = os.path.splitext(self.deleted_name)[0]
+        files = self.files()
+        self.assertNotIn(self.deleted_name, files)
+        self.assertFalse(any(name.startswith(f'variants/{stem}/') for name in files))
+        self.assertIn(self.kept.image.name, files)
+        self.assertFalse(ImageBlob.objects.filter(name=self.deleted_name).exists())
+
+    def test_blobs_referenced_again_are_kept(self):
+        ImageBlob.objects.update(updated_at=timezone.now() - timedelta(days=2))
+        # As if the kept image had been uploaded between the query and the collection.
+        with patch.object(ImageBlobQuerySet, 'unreferenced', lambda qs: qs.all()):
+            call_command('collect_orphaned_media', stdout=StringIO())
+        self.assertIn(self.kept.image.name, self.files())
+        self.assertTrue(ImageBlob.objects.filter(name=self.kept.image.name).exists())
+
+
+class ImportRecipesCommandTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='chef', password='password')
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+
+    def row(self, title, **overrides):
+        row = {
+            'title': title, 'author': 'chef', 'servings': 2, 'prepration_time': '00:10:00',
+            'total_time': '00:30:00', 'calories': 300, 'instructions': 'Cook it.', 'featured': False,
+            'cuisine': Recipe.CuisineType.CHINESE, 'food_type': Recipe.FoodType.VEGAN,
+            'difficulty': Recipe.DifficultyLevel.EASY,
+            'ingredients': [{'name': 'Tofu', 'quantity': 200, 'unit': RecipeIngredient.UnitType.GRAMS}],
+        }
+        row.update(overrides)
+        return row
+
+    def write_jsonl(self, rows):
+        path = os.path.join(self.directory, 'recipes.jsonl')
+        with open(path, 'w') as output:
+            for row in rows:
+                output.write((row if isinstance(row, str) else json.dumps(row)) + '\n')
+        return path
+
+    def test_imports_valid_rows_in_batches(self):
+        path = self.write_jsonl([
+            self.row('Mapo Tofu'),
+            self.row('Bad Times', prepration_time='01:00:00'),
+            self.row('Nobody', author='ghost'),
+            'not json',
+            self.row('Fried Rice', ingredients=[
+                {'name': 'Rice', 'quantity': 1, 'unit': RecipeIngredient.UnitType.CUP},
+                {'name': 'Egg', 'quantity': 2, 'unit': RecipeIngredient.UnitType.NUMBERS, 'optional': True},
+            ]),
+        ])
+        out, err = StringIO(), StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('import_recipes', path, '--batch-size', '2', stdout=out, stderr=err)
+
+        self.assertEqual(sorted(Recipe.objects.values_list('title', flat=True)), ['Fried Rice', 'Mapo Tofu'])
+        rice = Recipe.objects.get(title='Fried Rice')
+        self.assertEqual(rice.author, self.user)
+        self.assertEqual(rice.num_ingredients, 2)
+        self.assertTrue(rice.ingredients.get(name='Egg').optional)
+        self.assertEqual(list(Recipe.objects.filter(get_search_backend().match('tofu')).values_list('title', flat=True)), ['Mapo Tofu'])
+        self.assertIn('Row 2 rejected', err.getvalue())
+        self.assertIn("No user named 'ghost'", err.getvalue())
+        self.assertIn('Row 4 rejected', err.getvalue())
+        self.assertIn('Rows 5-5: 1 imported, 0 rejected', out.getvalue())
+        self.assertIn('Imported 2 recipes; rejected 3 rows.', out.getvalue())
+
+    def test_malformed_rows_are_rejected_not_fatal(self):
+        path = self.write_jsonl([
+            self.row('String ingredients', ingredients='salt'),
+            self.row('Nested ingredients', ingredients=[['salt']]),
+            self.row('Number ingredients', ingredients=5),
+            self.row('Escaping image', images=[{'image': '../../etc/passwd'}]),
+            self.row('Image list', images=['photo.jpg']),
+            self.row('List author', author=['chef']),
+            self.row('Kept'),
+        ])
+        err = StringIO()
+        call_command('import_recipes', path, stdout=StringIO(), stderr=err)
+        self.assertEqual(list(Recipe.objects.values_list('title', flat=True)), ['Kept'])
+        for number in range(1, 7):
+            self.assertIn(f'Row {number} rejected', err.getvalue())
+
+    def test_undecodable_rows_are_rejected_not_fatal(self):
+        good = json.dumps(self.row('Kept')).encode()
+        bad = json.dumps(self.row('Broken')).encode().replace(b'Broken', b'Bro\xffken')
+        path = os.path.join(self.directory, 'recipes.jsonl')
+        with open(path, 'wb') as output:
+            output.write(bad + b'\n' + good + b'\n')
+        err = StringIO()
+        call_command('import_recipes', path, stdout=StringIO(), stderr=err)
+        self.assertEqual(list(Recipe.objects.values_list('title', flat=True)), ['Kept'])
+        self.assertIn('Row 1 rejected: not valid UTF-8', err.getvalue())
+
+        row = self.row('Broken CSV')
+        path = os.path.join(self.directory, 'recipes.csv')
+        with open(path, 'w', newline='') as output:
+            writer = csv.DictWriter(output, fieldnames=list(row))
+            writer.writeheader()
+            writer.writerow({**row, 'ingredients': json.dumps(row['ingredients'])})
+            writer.writerow({**row, 'title': 'Kept CSV', 'ingredients': json.dumps(row['ingredients'])})
+        with open(path, 'rb') as source:
+            data = source.read().replace(b'Broken CSV', b'Broken \xfe')
+        with open(path, 'wb') as output:
+            output.write(data)
+        err = StringIO()
+        call_command('import_recipes', path, stdout=StringIO(), stderr=err)
+        self.assertTrue(Recipe.objects.filter(title='Kept CSV').exists())
+        self.assertIn('Row 1 rejected: not valid UTF-8', err.getvalue())
+
+    def test_authors_are_looked_up_per_batch(self):
+        path = self.write_jsonl([self.row(f'Recipe {n}', author=f'ghost {n}') for n in range(4)] + [self.row('Kept')])
+        resolve_authors = ImportRecipesCommand.resolve_authors
+        with patch.object(ImportRecipesCommand, 'resolve_authors', autospec=True, side_effect=resolve_authors) as resolve:
+            call_command('import_recipes', path, '--batch-size', '2', stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(resolve.call_count, 3)
+        self.assertFalse(hasattr(resolve.call_args.args[0], 'authors'))
+        self.assertEqual(list(Recipe.objects.values_list('title', flat=True)), ['Kept'])
+
+    def test_writes_each_batch_with_a_fixed_number_of_queries(self):
+        path = self.write_jsonl([self.row(f'Recipe {n}') for n in range(20)])
+        with CaptureQueriesContext(connection) as queries:
+            call_command('import_recipes', path, '--batch-size', '20', stdout=StringIO())
+        inserts = [query['sql'] for query in queries if query['sql'].startswith('INSERT INTO "recipeApp_recipe')]
+        self.assertEqual(len(inserts), 2)
+        self.assertEqual(RecipeIngredient.objects.count(), 20)
+
+    def test_resumes_from_checkpoint(self):
+        path = self.write_jsonl([self.row(f'Recipe {n}') for n in range(5)])
+        checkpoint = os.path.join(self.directory, 'checkpoint.json')
+        with open(checkpoint, 'w') as state:
+            json.dump({'rows': 3}, state)
+
+        out = StringIO()
+        call_command('import_recipes', path, '--checkpoint', checkpoint, '--batch-size', '1', stdout=out)
+        self.assertEqual(sorted(Recipe.objects.values_list('title', flat=True)), ['Recipe 3', 'Recipe 4'])
+        self.assertIn('Resuming after row 3.', out.getvalue())
+        with open(checkpoint) as state:
+            self.assertEqual(json.load(state), {'rows': 5})
+
+    def test_csv_with_json_cells(self):
+        path = os.path.join(self.directory, 'recipes.csv')
+        row = self.row('Dumplings', featured='true')
+        with open(path, 'w', newline='') as output:
+            writer = csv.DictWriter(output, fieldnames=list(row))
+            writer.writeheader()
+            writer.writerow({**row, 'ingredients': json.dumps(row['ingredients'])})
+        call_command('import_recipes', path, stdout=StringIO())
+        recipe = Recipe.objects.get()
+        self.assertTrue(recipe.featured)
+        self.assertEqual(recipe.ingredients.get().name, 'Tofu')
+
+
+class CatalogueExportTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='chef', password='password')
+        self.recipes = []
+        for n, cuisine in enumerate([Recipe.CuisineType.CHINESE, Recipe.CuisineType.NORTH_INDIAN] * 3):
+            recipe = Recipe.objects.create(
+                author=self.user, title=f'Recipe {n}', servings=2, prepration_time=timedelta(minutes=10),
+                total_time=timedelta(minutes=30), calories=100 + n, instructions='Cook it.', cuisine=cuisine,
+                food_type=Recipe.FoodType.VEGAN, difficulty=Recipe.DifficultyLevel.EASY, featured=n == 0,
+            )
+            RecipeIngredient.objects.create(recipe=recipe, name=f'Ingredient {n}', quantity=1, unit=RecipeIngredient.UnitType.CUP)
+            self.recipes.append(recipe)
+        self.collection = RecipeCollection.objects.create(title='Favourites', user=self.user)
+        self.collection.recipes.add(*self.recipes[:2])
+        self.client.login(username='chef', password='password')
+
+    def lines(self, response):
+        return b''.join(response.streaming_content).decode().splitlines()
+
+    def test_jsonl_applies_the_list_filters(self):
+        response = self.client.get(reverse('recipe_export'), {'cuisine': Recipe.CuisineType.CHINESE, 'format': 'jsonl'})
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertIn('attachment; filename="recipes.jsonl"', response['Content-Disposition'])
+        rows = [json.loads(line) for line in self.lines(response)]
+        self.assertEqual([row['title'] for row in rows], ['Recipe 4', 'Recipe 2', 'Recipe 0'])
+        self.assertEqual(rows[2]['ingredients'], [{'name': 'Ingredient 0', 'quantity': 1.0, 'unit': 6, 'optional': False}])
+        self.assertEqual(rows[2]['prepration_time'], '00:10:00')
+        self.assertEqual(rows[2]['author'], 'chef')
+
+    def test_csv_has_a_header_and_json_cells(self):
+        response = self.client.get(reverse('recipe_export'), {'format': 'csv', 'sort_by_calories': 'calories'})
+        rows = list(csv.DictReader(self.lines(response)))
+        self.assertEqual([row['title'] for row in rows], [f'Recipe {n}' for n in range(6)])
+        self.assertEqual(json.loads(rows[0]['ingredients'])[0]['name'], 'Ingredient 0')
+        self.assertEqual(self.client.get(reverse('recipe_export'), {'format': 'xml'}).status_code, 400)
+
+    @override_settings(PAGE_CACHE_TIMEOUT=0)
+    def test_list_links_export_the_current_filters(self):
+        response = self.client.get(reverse('recipe_list'))
+        self.assertContains(response, f'href="{reverse("recipe_export")}?format=csv"')
+        response = self.client.get(reverse('recipe_list'), {'cuisine': 3, 'format': 'jsonl', 'page': 2, 'cursor': 'x'})
+        self.assertContains(response, f'href="{reverse("recipe_export")}?cuisine=3&amp;format=csv"')
+        self.assertContains(response, f'href="{reverse("recipe_export")}?cuisine=3&amp;format=jsonl"')
+
+    def test_prefetches_per_chunk(self):
+        with CaptureQueriesContext(connection) as queries:
+            rows = list(recipe_rows(Recipe.objects.order_by('pk'), chunk_size=2))
+        self.assertEqual(len(rows), 6)
+        # The recipes are read through one cursor; ingredients and images are fetched per chunk of two.
+        self.assertEqual(len(queries), 1 + 3 * 2)
+
+    def test_collections_and_command(self):
+        response = self.client.get(reverse('collection_export'))
+        rows = [json.loads(line) for line in self.lines(response)]
+        self.assertEqual(rows[0]['recipes'], [self.recipes[0].pk, self.recipes[1].pk])
+
+        out = StringIO()
+        call_command('export_catalogue', 'recipes', '--filter', 'search=Ingredient 5', '--chunk-size', '2', stdout=out)
+        self.assertEqual([json.loads(line)['title'] for line in out.getvalue().splitlines()], ['Recipe 5'])
+
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'recipes.csv')
+        call_command('export_catalogue', 'recipes', '--format', 'csv', '--output', path)
+        with open(path, newline='') as exported:
+            self.assertEqual(len(list(csv.DictReader(exported))), 6)
+
+    def test_command_exports_one_users_rows(self):
+        other = User.objects.create_user(username='other', password='password')
+        self.recipes[0].author = other
+        self.recipes[0].save()
+        with self.assertRaisesMessage(CommandError, '--user'):
+            call_command('export_catalogue', 'recipes', '--filter', 'user_filter=true', stdout=StringIO())
+        with self.assertRaisesMessage(CommandError, 'nobody'):
+            call_command('export_catalogue', 'recipes', '--user', 'nobody', stdout=StringIO())
+
+        out = StringIO()
+        call_command('export_catalogue', 'recipes', '--filter', 'user_filter=true', '--user', 'other', stdout=out)
+        self.assertEqual([json.loads(line)['title'] for line in out.getvalue().splitlines()], ['Recipe 0'])
+        out = StringIO()
+        call_command('export_catalogue', 'collections', '--filter', 'user_filter=true', '--user', 'chef', stdout=out)
+        self.assertEqual([json.loads(line)['title'] for line in out.getvalue().splitlines()], ['Favourites'])
+
+    def test_export_can_be_imported(self):
+        out = StringIO()
+        call_command('export_catalogue', 'recipes', stdout=out)
+        Recipe.objects.all().delete()
+        path = os.path.join(self.enterContext(tempfile.TemporaryDirectory()), 'recipes.jsonl')
+        with open(path, 'w') as exported:
+            exported.write(out.getvalue())
+        call_command('import_recipes', path, stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(Recipe.objects.count(), 6)
+        self.assertEqual(RecipeIngredient.objects.count(), 6)
+
+
+@override_settings(IMAGE_VARIANT_WORKERS=0)
+class CollectionDownloadTests(TestCase):
+
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+        self.user = User.objects.create_user(username='chef', password='password')
+        self.collection = RecipeCollection.objects.create(title='Weeknight Dinners', user=self.user)
+        self.photo = bytes(range(256)) * 1000
+        for n in range(3):
+            recipe = Recipe.objects.create(
+                author=self.user, title=f'Recipe {n}', servings=2, prepration_time=timedelta(minutes=10),
+                total_time=timedelta(minutes=30), calories=100, instructions=f'Step {n}.',
+                cuisine=Recipe.CuisineType.CHINESE, food_type=Recipe.FoodType.VEGAN, difficulty=Recipe.DifficultyLevel.EASY,
+            )
+            RecipeIngredient.objects.create(recipe=recipe, name='Rice', quantity=1, unit=RecipeIngredient.UnitType.CUP, optional=n == 1)
+            if n != 2:
+                with patch('recipeApp.signals.refresh_variants'):
+                    RecipeImage.objects.create(recipe=recipe, image=SimpleUploadedFile('photo.jpg', self.photo + bytes([n])))
+            self.collection.recipes.add(recipe)
+        self.client.login(username='chef', password='password')
+
+    def test_streams_recipes_and_images(self):
+        response = self.client.get(reverse('collection_download', args=[self.collection.pk]))
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertIn('filename="weeknight-dinners.zip"', response['Content-Disposition'])
+        self.assertTrue(response.streaming)
+        chunks = list(response.streaming_content)
+        self.assertGreater(len(chunks), 3)
+
+        with zipfile.ZipFile(BytesIO(b''.join(chunks))) as archive:
+            self.assertEqual(archive.namelist(), [
+                'weeknight-dinners/001-recipe-0/recipe.txt',
+                'weeknight-dinners/001-recipe-0/images/01.jpg',
+                'weeknight-dinners/002-recipe-1/recipe.txt',
+                'weeknight-dinners/002-recipe-1/images/01.jpg',
+                'weeknight-dinners/003-recipe-2/recipe.txt',
+            ])
+            self.assertEqual(archive.read('weeknight-dinners/002-recipe-1/images/01.jpg'), self.photo + bytes([1]))
+            text = archive.read('weeknight-dinners/002-recipe-1/recipe.txt').decode()
+            self.assertIn('- 1.0 cup of Rice (optional)', text)
+            self.assertIn('Step 1.', text)
+            self.assertIsNone(archive.testzip())
+
+    def test_reads_recipes_in_chunks(self):
+        with CaptureQueriesContext(connection) as queries:
+            b''.join(collection_archive(self.collection, chunk_size=2))
+        # One cursor over the members, then ingredients and images for each chunk of two.
+        self.assertEqual(len(queries), 1 + 2 * 2)
+
+    def test_requires_login(self):
+        self.client.logout()
+        response = self.client.get(reverse('collection_download', args=[self.collection.pk]))
+        self.assertEqual(response.status_code, 302)
+
+
+class RecipeApiTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='chef', password='password')
+        self.recipes = []
+        for n in range(5):
+            recipe = Recipe.objects.create(
+                author=self.user, title=f'Recipe {n}', servings=2, prepration_time=timedelta(minutes=10),
+                total_time=timedelta(minutes=30), calories=100 + n, instructions='Cook it.',
+                cuisine=Recipe.CuisineType.CHINESE if n % 2 else Recipe.CuisineType.NORTH_INDIAN,
+                food_type=Recipe.FoodType.VEGAN, difficulty=Recipe.DifficultyLevel.EASY,
+            )
+            for name in ('Rice', 'Salt'):
+                RecipeIngredient.objects.create(recipe=recipe, name=name, quantity=1, unit=RecipeIngredient.UnitType.CUP)
+            self.recipes.append(recipe)
+        self.collection = RecipeCollection.objects.create(title='Favourites', user=self.user)
+        self.collection.recipes.add(self.recipes[0], self.recipes[3])
+
+    def test_list_pages_with_cursors_and_sparse_fields(self):
+        response = self.client.get(reverse('api_recipe_list'), {'fields': 'id,title', 'limit': 2})
+        body = response.json()
+        self.assertEqual(body['results'], [
+            {'id': self.recipes[4].pk, 'title': 'Recipe 4'},
+            {'id': self.recipes[3].pk, 'title': 'Recipe 3'},
+        ])
+        self.assertIsNone(body['previous'])
+
+        titles = []
+        cursor = None
+        while True:
+            params = {'fields': 'title', 'limit': 2, 'sort_by_calories': 'calories'}
+            if cursor:
+                params['cursor'] = cursor
+            body = self.client.get(reverse('api_recipe_list'), params).json()
+            titles += [row['title'] for row in body['results']]
+            cursor = body['next']
+            if not cursor:
+                break
+        self.assertEqual(titles, [f'Recipe {n}' for n in range(5)])
+
+    def test_list_applies_recipe_filters(self):
+        body = self.client.get(reverse('api_recipe_list'), {'cuisine': Recipe.CuisineType.CHINESE, 'fields': 'title'}).json()
+        self.assertEqual([row['title'] for row in body['results']], ['Recipe 3', 'Recipe 1'])
+        body = self.client.get(reverse('api_recipe_list'), {'search': 'recipe 2', 'fields': 'title'}).json()
+        self.assertEqual([row['title'] for row in body['results']], ['Recipe 2'])
+
+    def test_lists_report_their_ordering_and_reject_sorts_they_cannot_page(self):
+        body = self.client.get(reverse('api_recipe_list'), {'sort_by_calories': 'calories_desc', 'fields': 'id'}).json()
+        self.assertEqual(body['ordering'], '-calories')
+        # Relevance has no key to seek past, so searches come newest first and say so.
+        body = self.client.get(reverse('api_recipe_list'), {'search': 'recipe', 'fields': 'title'}).json()
+        self.assertEqual(body['ordering'], '-created_at')
+        self.assertEqual([row['title'] for row in body['results']], [f'Recipe {n}' for n in reversed(range(5))])
+
+        for params in ({'sort_by_calories': 'calories,-calories'}, {'sort_by_calories': 'calories', 'sort_by_created': 'created_at'}):
+            response = self.client.get(reverse('api_recipe_list'), params)
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('sort', response.json()['error'].lower())
+
+    def test_includes_cost_one_query_each_and_no_model_instances(self):
+        with CaptureQueriesContext(connection) as queries, patch.object(Recipe, '__init__') as init:
+            body = self.client.get(reverse('api_recipe_list'), {'include': 'ingredients,images', 'limit': 100}).json()
+        init.assert_not_called()
+        self.assertEqual(len(queries), 3)
+        first = body['results'][0]
+        self.assertEqual(first['author'], 'chef')
+        self.assertEqual(first['prepration_time'], 'P0DT00H10M00S')
+        self.assertEqual([i['name'] for i in first['ingredients']], ['Rice', 'Salt'])
+        self.assertEqual(first['images'], [])
+
+    def test_rejects_unknown_fields_and_includes(self):
+        self.assertEqual(self.client.get(reverse('api_recipe_list'), {'fields': 'title,password'}).status_code, 400)
+        response = self.client.get(reverse('api_recipe_list'), {'include': 'comments'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('comments', response.json()['error'])
+
+    def test_my_recipes_and_collections_need_a_login(self):
+        for name, count in (('api_recipe_list', 5), ('api_collection_list', 1)):
+            self.assertEqual(self.client.get(reverse(name), {'user_filter': 'true'}).status_code, 401, name)
+            self.assertEqual(self.client.get(reverse(name), {'user_filter': 'false'}).status_code, 200, name)
+            self.client.login(username='chef', password='password')
+            body = self.client.get(reverse(name), {'user_filter': 'true', 'fields': 'id'}).json()
+            self.assertEqual(len(body['results']), count, name)
+            self.client.logout()
+
+    def test_details_need_a_login(self):
+        url = reverse('api_recipe_detail', args=[self.recipes[0].pk])
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.login(username='chef', password='password')
+        body = self.client.get(url, {'fields': 'title,num_ingredients', 'include': 'ingredients'}).json()
+        self.assertEqual(body['title'], 'Recipe 0')
+        self.assertEqual(body['num_ingredients'], 2)
+        self.assertEqual(len(body['ingredients']), 2)
+        self.assertEqual(self.client.get(reverse('api_recipe_detail', args=[0])).status_code, 404)
+
+    def test_collections(self):
+        body = self.client.get(reverse('api_collection_list'), {'include': 'recipes'}).json()
+        self.assertEqual(body['results'][0]['recipes'], [self.recipes[0].pk, self.recipes[3].pk])
+        self.assertEqual(body['results'][0]['num_recipes'], 2)
+        self.client.login(username='chef', password='password')
+        body = self.client.get(reverse('api_collection_detail', args=[self.collection.pk]), {'fields': 'user'}).json()
+        self.assertEqual(body, {'user': 'chef'})
+
+
 class RecipeIngredientModelTest(TestCase):
     
     def setUp(self):
@@ -152,8 +1032,121 @@ class RecipeCollectionModelTest(TestCase):
         self.assertEqual(str(self.collection), 'My Recipe Collection (1 recipes)')
 
 
+class CounterTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.recipes = [
+            Recipe.objects.create(
+                author=self.user,
+                title=f'Recipe {i}',
+                servings=2,
+                prepration_time=timedelta(minutes=10),
+                total_time=timedelta(minutes=20),
+                calories=100,
+                instructions='Instructions.',
+                cuisine=Recipe.CuisineType.CHINESE,
+                food_type=Recipe.FoodType.VEGAN,
+                difficulty=Recipe.DifficultyLevel.EASY
+            )
+            for i in range(3)
+        ]
+        self.collection = RecipeCollection.objects.create(title='Collection', user=self.user)
+
+    def stored(self, obj):
+        return type(obj).objects.values_list(
+            'num_ingredients' if isinstance(obj, Recipe) else 'num_recipes', flat=True
+        ).get(pk=obj.pk)
+
+    def test_ingredient_count_follows_adds_and_deletes(self):
+        recipe = self.recipes[0]
+        salt = RecipeIngredient.objects.create(recipe=recipe, name='Salt', quantity=1, unit=RecipeIngredient.UnitType.GRAMS)
+        RecipeIngredient.objects.create(recipe=recipe, name='Oil', quantity=1, unit=RecipeIngredient.UnitType.TABLESPOON)
+        self.assertEqual(recipe.get_total_ingredients(), 2)
+        self.assertEqual(self.stored(recipe), 2)
+
+        salt.recipe = self.recipes[1]
+        salt.save()
+        self.assertEqual(self.stored(recipe), 1)
+        self.assertEqual(self.stored(self.recipes[1]), 1)
+
+        salt.delete()
+        self.assertEqual(self.stored(self.recipes[1]), 0)
+
+    def test_recipe_count_follows_m2m_changes(self):
+        self.collection.recipes.add(self.recipes[0], self.recipes[1])
+        self.collection.recipes.add(self.recipes[0])
+        self.assertEqual(self.collection.recipe_count(), 2)
+
+        self.collection.recipes.remove(self.recipes[0], self.recipes[2])
+        self.assertEqual(self.collection.recipe_count(), 1)
+
+        self.recipes[2].collections.add(self.collection)
+        self.assertEqual(self.stored(self.collection), 2)
+
+        self.recipes[2].collections.clear()
+        self.assertEqual(self.stored(self.collection), 1)
+
+        self.recipes[1].delete()
+        self.assertEqual(self.stored(self.collection), 0)
+
+    def test_form_save_m2m_updates_count(self):
+        form = RecipeCollectionForm(
+            data={'title': 'Edited', 'recipes': [r.pk for r in self.recipes]}, instance=self.collection
+        )
+        self.assertTrue(form.is_valid())
+        form.save()
+        self.assertEqual(self.stored(self.collection), 3)
+
+    def test_collection_list_renders_counts_without_counting(self):
+        self.collection.recipes.add(*self.recipes)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('collection_list'))
+        self.assertContains(response, '<span class="font-bold">3</span>', html=True)
+        self.assertFalse([q for q in queries if 'recipecollection_recipes' in q['sql']])
+
+    def test_saving_a_stale_instance_keeps_the_counters(self):
+        recipe = Recipe.objects.get(pk=self.recipes[0].pk)
+        collection = RecipeCollection.objects.get(pk=self.collection.pk)
+        RecipeIngredient.objects.create(recipe=self.recipes[0], name='Salt', quantity=1, unit=RecipeIngredient.UnitType.GRAMS)
+        self.collection.recipes.add(self.recipes[0])
+
+        recipe.title = 'Edited'
+        recipe.save()
+        collection.title = 'Edited'
+        collection.save()
+        self.assertEqual(self.stored(recipe), 1)
+        self.assertEqual(self.stored(collection), 1)
+        self.assertEqual(Recipe.objects.get(pk=recipe.pk).title, 'Edited')
+
+    def test_repair_counters_fixes_drift(self):
+        self.collection.recipes.add(*self.recipes)
+        RecipeIngredient.objects.create(recipe=self.recipes[0], name='Salt', quantity=1, unit=RecipeIngredient.UnitType.GRAMS)
+        Recipe.objects.update(num_ingredients=7)
+        RecipeCollection.objects.update(num_recipes=0)
+
+        out = StringIO()
+        call_command('repair_counters', '--dry-run', stdout=out)
+        self.assertIn('3 recipe ingredient counts would be repaired', out.getvalue())
+        self.assertEqual(self.stored(self.recipes[0]), 7)
+
+        call_command('repair_counters', stdout=StringIO())
+        self.assertEqual([self.stored(r) for r in self.recipes], [1, 0, 0])
+        self.assertEqual(self.stored(self.collection), 3)
+
+
+class RecipeIndexUsageTests(TestCase):
+
+    def test_every_list_query_uses_an_index(self):
+        """Fails when a filter/sort combination on the list page falls back to a table scan or sort."""
+        out = StringIO()
+        call_command('benchmark_recipe_filters', '--recipes', '500', '--repeat', '1', '--strict', stdout=out)
+        self.assertNotIn('NO INDEX', out.getvalue())
+        self.assertFalse(Recipe.objects.exists())
+
+
 # view testing
 
+@override_settings(PAGE_CACHE_TIMEOUT=0)  # These read response.context, which a cached page lacks.
 class HomePageViewTests(TestCase):
     def test_home_page_status_code(self):
         response = self.client.get(reverse('home'))  
@@ -210,6 +1203,211 @@ class RecipeListViewTests(TestCase):
         self.assertEqual(len(response.context['recipes']), 2)  
 
 
+@override_settings(SHARED_CACHE=True)
+class AnonymousPageCacheTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.recipe = Recipe.objects.create(
+            author=self.user,
+            title='Cached page recipe',
+            servings=2,
+            prepration_time=timedelta(minutes=10),
+            total_time=timedelta(minutes=20),
+            calories=100,
+            instructions='Instructions.',
+            cuisine=Recipe.CuisineType.CHINESE,
+            food_type=Recipe.FoodType.VEGAN,
+            difficulty=Recipe.DifficultyLevel.EASY
+        )
+
+    def test_anonymous_pages_are_cached_per_normalized_query(self):
+        first = self.client.get(reverse('recipe_list'), {'search': 'cached', 'cuisine': '', 'food_type': '3'})
+        self.assertIn('public', first['Cache-Control'])
+        self.assertIn('Cookie', first['Vary'])
+        with self.assertNumQueries(0):
+            second = self.client.get(reverse('recipe_list') + '?food_type=3&search=cached')
+        self.assertEqual(second.content, first.content)
+
+    def test_recipe_writes_invalidate_cached_pages(self):
+        self.client.get(reverse('recipe_list'))
+        self.recipe.title = 'Renamed page recipe'
+        self.recipe.save()
+        self.assertContains(self.client.get(reverse('recipe_list')), 'Renamed page recipe')
+
+    @override_settings(SHARED_CACHE=False)
+    def test_pages_are_not_cached_without_a_shared_cache(self):
+        self.client.get(reverse('recipe_list'))
+        # A write in another worker would not reach this process's cache.
+        Recipe.objects.filter(pk=self.recipe.pk).update(title='Renamed elsewhere', updated_at=timezone.now())
+        response = self.client.get(reverse('recipe_list'))
+        self.assertContains(response, 'Renamed elsewhere')
+        self.assertIsNotNone(response.context)
+
+    def test_signed_in_users_bypass_the_cache(self):
+        self.client.get(reverse('recipe_list'))
+        self.client.login(username='testuser', password='testpass')
+        response = self.client.get(reverse('recipe_list'))
+        self.assertIsNotNone(response.context)
+        self.assertIn('private', response['Cache-Control'])
+
+    def test_responses_with_a_csrf_token_are_not_cached(self):
+        calls = []
+
+        @anonymous_page_cache
+        def view(request):
+            calls.append(request)
+            return HttpResponse(Template('{% csrf_token %}').render(RequestContext(request)))
+
+        for _ in range(2):
+            request = RequestFactory().get('/csrf/')
+            request.user = AnonymousUser()
+            view(request)
+        self.assertEqual(len(calls), 2)
+
+
+@override_settings(SHARED_CACHE=True)
+class RecipeListQueryCountTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+
+    def create_recipes(self, count, featured):
+        for i in range(count):
+            recipe = Recipe.objects.create(
+                author=self.user,
+                title=f'Recipe {i}',
+                servings=2,
+                prepration_time=timedelta(minutes=10),
+                total_time=timedelta(minutes=20),
+                calories=100 + i,
+                instructions='Instructions.',
+                featured=featured,
+                cuisine=Recipe.CuisineType.CHINESE,
+                food_type=Recipe.FoodType.VEGAN,
+                difficulty=Recipe.DifficultyLevel.EASY
+            )
+            RecipeImage.objects.create(recipe=recipe, image=f'recipe_images/cover_{i}.jpg')
+            RecipeImage.objects.create(recipe=recipe, image=f'recipe_images/extra_{i}.jpg')
+
+    def test_query_count_does_not_grow_with_cards(self):
+        """The list page costs the same number of queries for one card or a full page."""
+        self.create_recipes(1, featured=True)
+        self.create_recipes(1, featured=False)
+        with self.assertNumQueries(7):
+            self.client.get(reverse('recipe_list'))
+
+        self.create_recipes(10, featured=True)
+        self.create_recipes(10, featured=False)
+        with patch.object(RecipeListView, 'paginate_by', 10):
+            with self.assertNumQueries(7):
+                response = self.client.get(reverse('recipe_list'))
+        self.assertEqual(len(response.context['recipes_page_obj']), 10)
+
+    def test_pages_from_cached_ids_without_counting(self):
+        self.create_recipes(5, featured=False)
+        self.client.get(reverse('recipe_list'))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('recipe_list'), {'page': 2})
+        self.assertEqual(len(response.context['recipes_page_obj']), 2)
+        self.assertFalse([q for q in queries if '"__COUNT"' in q['sql'].upper()])
+
+    def test_cards_are_rendered_from_cache_until_the_recipe_changes(self):
+        self.create_recipes(1, featured=False)
+        recipe = Recipe.objects.get()
+        self.client.get(reverse('recipe_list'))
+
+        # A queryset update leaves updated_at alone, so the cached card still shows.
+        Recipe.objects.filter(pk=recipe.pk).update(title='Renamed')
+        self.assertContains(self.client.get(reverse('recipe_list')), 'Recipe 0')
+
+        recipe.images.order_by('pk').first().delete()
+        response = self.client.get(reverse('recipe_list'))
+        self.assertContains(response, 'Renamed')
+        self.assertContains(response, '/media/recipe_images/extra_0.jpg')
+
+    def test_cards_show_first_image(self):
+        self.create_recipes(1, featured=False)
+        response = self.client.get(reverse('recipe_list'))
+        self.assertContains(response, '/media/recipe_images/cover_0.jpg')
+        self.assertNotContains(response, '/media/recipe_images/extra_0.jpg')
+
+
+@override_settings(CURSOR_PAGINATION=True)
+@override_settings(PAGE_CACHE_TIMEOUT=0)  # These read response.context, which a cached page lacks.
+class RecipeListCursorPaginationTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.recipes = [
+            Recipe.objects.create(
+                author=self.user,
+                title=f'Recipe {i}',
+                servings=2,
+                prepration_time=timedelta(minutes=10),
+                total_time=timedelta(minutes=20),
+                calories=100 * (i % 3),
+                instructions='Instructions.',
+                featured=False,
+                cuisine=Recipe.CuisineType.CHINESE,
+                food_type=Recipe.FoodType.VEGAN,
+                difficulty=Recipe.DifficultyLevel.EASY
+            )
+            for i in range(7)
+        ]
+
+    def walk(self, params):
+        seen, cursor = [], None
+        while True:
+            response = self.client.get(reverse('recipe_list'), {**params, **({'cursor': cursor} if cursor else {})})
+            page = response.context['recipes_page_obj']
+            seen.extend(recipe.pk for recipe in page)
+            if not page.has_next():
+                return seen, response
+            cursor = page.next_cursor
+
+    def test_walks_newest_first_without_counting(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('recipe_list'))
+        # The facet aggregate counts per option; only a paginator count is unwanted here.
+        self.assertFalse([q for q in queries if '"__COUNT"' in q['sql'].upper()])
+
+        RecipeCollection.objects.create(title='Weeknight', user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('collection_list'))
+        self.assertFalse([q for q in queries if '"__COUNT"' in q['sql'].upper()])
+        self.assertIsNone(response.context['collection_count'])
+        self.assertContains(response, 'Recipe Collections</h1>')
+
+        seen, _ = self.walk({})
+        expected = list(Recipe.objects.order_by('-created_at', '-pk').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_calorie_ordering_breaks_ties_on_id(self):
+        seen, _ = self.walk({'sort_by_calories': 'calories', 'food_type': Recipe.FoodType.VEGAN})
+        expected = list(Recipe.objects.order_by('calories', 'pk').values_list('pk', flat=True))
+        self.assertEqual(seen, expected)
+
+    def test_previous_cursor_returns_the_previous_page(self):
+        first = self.client.get(reverse('recipe_list')).context['recipes_page_obj']
+        second = self.client.get(reverse('recipe_list'), {'cursor': first.next_cursor}).context['recipes_page_obj']
+        self.assertTrue(second.has_previous())
+        back = self.client.get(reverse('recipe_list'), {'cursor': second.previous_cursor}).context['recipes_page_obj']
+        self.assertEqual([r.pk for r in back], [r.pk for r in first])
+        self.assertFalse(back.has_previous())
+
+    def test_invalid_cursor_falls_back_to_first_page(self):
+        response = self.client.get(reverse('recipe_list'), {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.context['recipes_page_obj']), 3)
+
+    def test_collection_list_uses_cursor(self):
+        for i in range(4):
+            RecipeCollection.objects.create(title=f'Collection {i}', user=self.user)
+        response = self.client.get(reverse('collection_list'))
+        page = response.context['page_obj']
+        self.assertTrue(page.has_next())
+        response = self.client.get(reverse('collection_list'), {'cursor': page.next_cursor})
+        self.assertEqual(len(response.context['collections']), 1)
+
+
 class RecipeCollectionListViewTests(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(username='testuser', password='testpass')
@@ -231,6 +1429,18 @@ class RecipeCollectionListViewTests(TestCase):
         self.assertIn('collections', response.context)
         self.assertEqual(len(response.context['collections']), 1)
 
+    def test_query_count_does_not_grow_with_rows(self):
+        """The page of collections with their owners, and a count the paginator shares."""
+        with self.assertNumQueries(2):
+            self.client.get(reverse('collection_list'))
+        for i in range(5):
+            owner = User.objects.create_user(username=f'owner{i}', password='testpass')
+            RecipeCollection.objects.create(title=f'Collection {i}', user=owner)
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('collection_list'))
+        self.assertEqual(response.context['collection_count'], 6)
+        self.assertContains(response, 'Created By: owner4')
+
 
 class RecipeDetailViewTests(TestCase):
     def setUp(self):
@@ -264,6 +1474,43 @@ class RecipeDetailViewTests(TestCase):
         response = self.client.get(reverse('recipe_detail', args=[self.recipe.pk]))
         self.assertRedirects(response, f"/account/login/?next=/recipes/{self.recipe.pk}/")
 
+    def test_unchanged_recipe_returns_not_modified(self):
+        url = reverse('recipe_detail', args=[self.recipe.pk])
+        first = self.client.get(url)
+        etag = first['ETag']
+        # Validated per viewer only: no Last-Modified for If-Modified-Since to match across users.
+        self.assertNotIn('Last-Modified', first)
+        self.assertIn('private', first['Cache-Control'])
+        with self.assertNumQueries(3):  # session, user, the validator row
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        RecipeIngredient.objects.create(recipe=self.recipe, name='Salt', quantity=1, unit=RecipeIngredient.UnitType.GRAMS)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_query_count_does_not_grow_with_images(self):
+        """Session, user, validators, then the recipe with its author, images and ingredients."""
+        url = reverse('recipe_detail', args=[self.recipe.pk])
+        RecipeIngredient.objects.create(recipe=self.recipe, name='Salt', quantity=1, unit=RecipeIngredient.UnitType.GRAMS)
+        RecipeImage.objects.create(recipe=self.recipe, image='recipe_images/only.jpg', description='Only image')
+        with self.assertNumQueries(6):
+            response = self.client.get(url)
+        self.assertContains(response, 'Only image')
+
+        RecipeImage.objects.bulk_create(
+            RecipeImage(recipe=self.recipe, image=f'recipe_images/extra_{i}.jpg') for i in range(49)
+        )
+        with self.assertNumQueries(6):
+            response = self.client.get(url)
+        self.assertContains(response, '/media/recipe_images/extra_48.jpg')
+
+    def test_etag_depends_on_the_viewer(self):
+        url = reverse('recipe_detail', args=[self.recipe.pk])
+        etag = self.client.get(url)['ETag']
+        User.objects.create_user(username='other', password='testpass')
+        self.client.login(username='other', password='testpass')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
 
 class RecipeCollectionDetailViewTests(TestCase):
     def setUp(self):
@@ -302,6 +1549,44 @@ class RecipeCollectionDetailViewTests(TestCase):
         response = self.client.get(reverse('collection_detail', args=[self.collection.pk]))
         self.assertRedirects(response, f"/account/login/?next=/collections/{self.collection.pk}/")
 
+    def test_query_count_does_not_grow_with_members(self):
+        """Session, user, validators, then the collection, its recipes and their cover images."""
+        url = reverse('collection_detail', args=[self.collection.pk])
+        with self.assertNumQueries(6):
+            self.client.get(url)
+        for i in range(20):
+            recipe = Recipe.objects.create(
+                author=self.user,
+                title=f'Member {i}',
+                servings=1,
+                prepration_time=timedelta(minutes=5),
+                total_time=timedelta(minutes=10),
+                calories=100,
+                instructions='Instructions.',
+                cuisine=Recipe.CuisineType.CHINESE,
+                food_type=Recipe.FoodType.VEGAN,
+                difficulty=Recipe.DifficultyLevel.EASY
+            )
+            RecipeImage.objects.create(recipe=recipe, image=f'recipe_images/member_{i}.jpg')
+            self.collection.recipes.add(recipe)
+        with self.assertNumQueries(6):
+            response = self.client.get(url)
+        self.assertContains(response, '/media/recipe_images/member_19.jpg')
+
+    def test_member_changes_invalidate_the_etag(self):
+        url = reverse('collection_detail', args=[self.collection.pk])
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.recipe.title = 'Renamed'
+        self.recipe.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertContains(response, 'Renamed')
+
+        etag = response['ETag']
+        self.collection.recipes.remove(self.recipe)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
 
 class RecipeCollectionCreateViewTests(TestCase):
 
@@ -402,6 +1687,82 @@ class RecipeCreateViewTests(TestCase):
         self.assertRedirects(response, "/account/login/?next=/recipes/create/")
 
 
+class RecipeWritePathTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+
+    def post_data(self, ingredients, initial=0, images=0, **extra):
+        data = {
+            'title': 'Bulk Recipe',
+            'servings': 4,
+            'prepration_time': timedelta(minutes=20),
+            'total_time': timedelta(minutes=20),
+            'calories': 500,
+            'instructions': 'Mix all ingredients.',
+            'cuisine': 1,
+            'food_type': 1,
+            'difficulty': 1,
+            'ingredients-TOTAL_FORMS': len(ingredients),
+            'ingredients-INITIAL_FORMS': initial,
+            'images-TOTAL_FORMS': images,
+            'images-INITIAL_FORMS': 0,
+        }
+        for i, ingredient in enumerate(ingredients):
+            data.update({f'ingredients-{i}-{key}': value for key, value in ingredient.items()})
+        data.update(extra)
+        return data
+
+    def test_many_ingredients_are_written_in_a_fixed_number_of_queries(self):
+        ingredients = [{'name': f'Spice {i}', 'quantity': 1, 'unit': 1} for i in range(60)]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('recipe-create'), self.post_data(ingredients))
+        self.assertEqual(response.status_code, 302)
+        self.assertLess(len(queries), 20)
+        recipe = Recipe.objects.get(title='Bulk Recipe')
+        self.assertEqual(recipe.num_ingredients, 60)
+        self.assertEqual(recipe.ingredients.count(), 60)
+        self.assertEqual(list(get_search_backend().search(Recipe.objects.all(), 'spice')), [recipe])
+
+    def test_invalid_ingredient_writes_nothing(self):
+        ingredients = [{'name': 'Salt', 'quantity': 1, 'unit': 1}, {'name': 'Pepper', 'unit': 1}]
+        response = self.client.post(reverse('recipe-create'), self.post_data(ingredients))
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(Recipe.objects.exists())
+
+    def test_failure_part_way_leaves_no_recipe_behind(self):
+        data = self.post_data([{'name': 'Salt', 'quantity': 1, 'unit': 1}])
+        with patch.object(RecipeIngredient.objects, 'bulk_create', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                self.client.post(reverse('recipe-create'), data)
+        self.assertFalse(Recipe.objects.exists())
+        self.assertFalse(RecipeIngredient.objects.exists())
+
+    def test_update_adds_changes_and_removes_rows(self):
+        self.client.post(reverse('recipe-create'), self.post_data([
+            {'name': 'Salt', 'quantity': 1, 'unit': 1},
+            {'name': 'Oil', 'quantity': 1, 'unit': 1},
+        ]))
+        recipe = Recipe.objects.get()
+        salt, oil = recipe.ingredients.order_by('pk')
+        reset_ingredient_index()
+        index = get_ingredient_index()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(reverse('recipe_edit', args=[recipe.pk]), self.post_data([
+                {'id': salt.pk, 'recipe': recipe.pk, 'name': 'Sea Salt', 'quantity': 2, 'unit': 1},
+                {'id': oil.pk, 'recipe': recipe.pk, 'name': 'Oil', 'quantity': 1, 'unit': 1, 'DELETE': 'on'},
+                {'name': 'Garlic', 'quantity': 3, 'unit': 1},
+            ], initial=2))
+        self.assertEqual(response.status_code, 302)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.num_ingredients, 2)
+        self.assertEqual(sorted(recipe.ingredients.values_list('name', flat=True)), ['Garlic', 'Sea Salt'])
+        self.assertEqual([name for name, _ in index.suggest('s')], ['sea salt'])
+        self.assertEqual(index.suggest('oil'), [])
+
+
 class RecipeUpdateViewTests(TestCase):
 
     def setUp(self):
@@ -492,6 +1853,13 @@ class RecipeDeleteViewTests(TestCase):
         response = self.client.get(reverse('recipe_delete', args=[self.recipe.pk]))
         self.assertEqual(response.status_code, 200)  # Allowed
 
+    def test_owner_check_shares_the_fetched_recipe(self):
+        """Session, user, then the recipe once: the owner is compared by id, not loaded."""
+        self.client.login(username='testuser', password='testpassword')
+        with self.assertNumQueries(3):
+            response = self.client.get(reverse('recipe_delete', args=[self.recipe.pk]))
+        self.assertContains(response, 'Test Recipe')
+
 
 class RecipeCollectionDeleteViewTests(TestCase):
     
@@ -614,6 +1982,54 @@ class RecipeCollectionFormTests(TestCase):
         self.assertFalse(form.is_valid())
         self.assertIn('recipes', form.errors)
 
+    def test_selected_recipes_are_checked_in_one_query(self):
+        other = Recipe.objects.create(
+            title='Other Recipe', servings=1, prepration_time=timedelta(minutes=5), total_time=timedelta(minutes=10),
+            calories=100, instructions="Step 1.", author=self.user, cuisine=1, food_type=1, difficulty=1,
+        )
+        form = RecipeCollectionForm(data={'title': 'My Collection', 'recipes': [self.recipe.pk, other.pk, 0]})
+        with self.assertNumQueries(1):
+            self.assertFalse(form.is_valid())
+        self.assertIn('recipes', form.errors)
+
+    def test_only_selected_recipes_are_rendered(self):
+        Recipe.objects.create(
+            title='Unselected Recipe', servings=1, prepration_time=timedelta(minutes=5), total_time=timedelta(minutes=10),
+            calories=100, instructions="Step 1.", author=self.user, cuisine=1, food_type=1, difficulty=1,
+        )
+        html = str(RecipeCollectionForm(initial={'recipes': [self.recipe.pk]})['recipes'])
+        self.assertIn('Test Recipe', html)
+        self.assertNotIn('Unselected Recipe', html)
+        self.assertEqual(str(RecipeCollectionForm()['recipes']).count('<input'), 0)
+
+
+class RecipePickerViewTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.client.login(username='testuser', password='testpass')
+        for i in range(25):
+            Recipe.objects.create(
+                title=f'Picker Recipe {i}', servings=1, prepration_time=timedelta(minutes=5),
+                total_time=timedelta(minutes=10), calories=100, instructions="Step 1.", author=self.user,
+                cuisine=1, food_type=1, difficulty=1,
+            )
+
+    def test_pages_through_recipes(self):
+        first = self.client.get(reverse('recipe_picker')).json()
+        self.assertEqual(len(first['results']), 20)
+        self.assertEqual(first['results'][0], {'id': Recipe.objects.latest('created_at').pk, 'title': 'Picker Recipe 24', 'author': 'testuser'})
+        second = self.client.get(reverse('recipe_picker'), {'cursor': first['next']}).json()
+        self.assertEqual(len(second['results']), 5)
+        self.assertIsNone(second['next'])
+
+    def test_searches_recipes(self):
+        results = self.client.get(reverse('recipe_picker'), {'q': 'recipe 7'}).json()['results']
+        self.assertEqual([r['title'] for r in results], ['Picker Recipe 7'])
+
+    def test_login_required(self):
+        self.client.logout()
+        self.assertEqual(self.client.get(reverse('recipe_picker')).status_code, 302)
+
 
 #filter test
 class RecipeFilterTests(TestCase):
@@ -694,6 +2110,269 @@ class RecipeFilterTests(TestCase):
         self.assertEqual(len(filter_set.qs), 3)  
 
 
+class RecipeSearchBackendTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='chef', password='password')
+        cls.curry = Recipe.objects.create(
+            author=cls.user,
+            title='Paneer Curry',
+            cuisine=Recipe.CuisineType.NORTH_INDIAN,
+            servings=4,
+            prepration_time=timedelta(minutes=20),
+            total_time=timedelta(minutes=40),
+            calories=450,
+            instructions='Simmer.',
+            food_type=Recipe.FoodType.VEGETARIAN,
+            difficulty=Recipe.DifficultyLevel.EASY
+        )
+        cls.dosa = Recipe.objects.create(
+            author=cls.user,
+            title='Masala Dosa',
+            cuisine=Recipe.CuisineType.SOUTH_INDIAN,
+            servings=2,
+            prepration_time=timedelta(minutes=20),
+            total_time=timedelta(minutes=40),
+            calories=300,
+            instructions='Spread the batter.',
+            food_type=Recipe.FoodType.VEGAN,
+            difficulty=Recipe.DifficultyLevel.MEDIUM
+        )
+        RecipeIngredient.objects.create(recipe=cls.dosa, name='Paneer crumbs', quantity=1, unit=RecipeIngredient.UnitType.CUP)
+
+    def search(self, value):
+        return list(RecipeFilter(data={'search': value}, queryset=Recipe.objects.all()).qs)
+
+    def test_prefix_search_ranks_title_matches_first(self):
+        self.assertEqual(self.search('pan'), [self.curry, self.dosa])
+
+    def test_index_follows_ingredient_changes(self):
+        ingredient = RecipeIngredient.objects.create(
+            recipe=self.curry, name='Fenugreek', quantity=1, unit=RecipeIngredient.UnitType.TEASPOON
+        )
+        self.assertEqual(self.search('fenugreek'), [self.curry])
+        ingredient.delete()
+        self.assertEqual(self.search('fenugreek'), [])
+
+    def test_index_follows_recipe_changes(self):
+        self.curry.title = 'Kadai Paneer'
+        self.curry.save()
+        self.assertEqual(self.search('kadai'), [self.curry])
+        self.curry.delete()
+        self.assertEqual(self.search('kadai'), [])
+
+    def test_punctuation_only_query_matches_nothing(self):
+        self.assertEqual(self.search('!!'), [])
+
+    def test_rebuild_restores_index(self):
+        backend = get_search_backend()
+        backend.remove_recipes([self.curry.pk, self.dosa.pk])
+        self.assertEqual(self.search('dosa'), [])
+        backend.rebuild()
+        self.assertEqual(self.search('dosa'), [self.dosa])
+
+
+class PrefixIndexTests(SimpleTestCase):
+
+    def test_suggests_most_used_names_for_prefix(self):
+        index = PrefixIndex({'Tomato': 5, 'tomato puree': 2, ' Tofu ': 7, 'Turmeric': 1})
+        self.assertEqual(index.suggest('to'), [('tofu', 7), ('tomato', 5), ('tomato puree', 2)])
+        self.assertEqual(index.suggest('TOM', limit=1), [('tomato', 5)])
+        self.assertEqual(index.suggest(''), [])
+
+    def test_updates_keep_memoised_prefixes_current(self):
+        counts = {f'salt {i:03d}': i + 1 for i in range(100)}
+        index = PrefixIndex(counts)
+        self.assertEqual(index.suggest('sa', limit=1), [('salt 099', 100)])
+        index.add('Saffron', 500)
+        self.assertEqual(index.suggest('sa', limit=1), [('saffron', 500)])
+        index.remove('saffron', 500)
+        index.remove('salt 099', 100)
+        self.assertEqual(index.suggest('sa', limit=1), [('salt 098', 99)])
+        self.assertEqual(len(index), 99)
+
+
+class IngredientAutocompleteViewTests(TestCase):
+    def setUp(self):
+        reset_ingredient_index()
+        self.addCleanup(reset_ingredient_index)
+        self.user = User.objects.create_user(username='testuser', password='testpass')
+        self.recipe = Recipe.objects.create(
+            author=self.user,
+            title='Recipe',
+            servings=2,
+            prepration_time=timedelta(minutes=10),
+            total_time=timedelta(minutes=20),
+            calories=100,
+            instructions='Instructions.',
+            cuisine=Recipe.CuisineType.CHINESE,
+            food_type=Recipe.FoodType.VEGAN,
+            difficulty=Recipe.DifficultyLevel.EASY
+        )
+        for name in ('Garlic', 'garlic ', 'Ginger'):
+            RecipeIngredient.objects.create(recipe=self.recipe, name=name, quantity=1, unit=RecipeIngredient.UnitType.NUMBERS)
+
+    def suggest(self, q):
+        response = self.client.get(reverse('ingredient_autocomplete'), {'q': q})
+        return [(result['name'], result['uses']) for result in response.json()['results']]
+
+    def test_returns_weighted_normalized_names(self):
+        self.assertEqual(self.suggest('g'), [('garlic', 2), ('ginger', 1)])
+
+    def test_index_follows_ingredient_signals(self):
+        self.assertEqual(self.suggest('gi'), [('ginger', 1)])
+        ingredient = RecipeIngredient.objects.get(name='Ginger')
+        ingredient.name = 'Galangal'
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient.save()
+        self.assertEqual(self.suggest('gi'), [])
+        self.assertEqual(self.suggest('gal'), [('galangal', 1)])
+        with self.captureOnCommitCallbacks(execute=True):
+            ingredient.delete()
+        self.assertEqual(self.suggest('gal'), [])
+
+    def test_index_ignores_rolled_back_ingredients(self):
+        self.assertEqual(self.suggest('g'), [('garlic', 2), ('ginger', 1)])
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                RecipeIngredient.objects.create(
+                    recipe=self.recipe, name='Galangal', quantity=1, unit=RecipeIngredient.UnitType.NUMBERS
+                )
+                RecipeIngredient.objects.get(name='Ginger').delete()
+                raise RuntimeError
+        self.assertEqual(callbacks, [])
+        self.assertEqual(self.suggest('g'), [('garlic', 2), ('ginger', 1)])
+
+
+class RecipeFacetCountTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='password')
+        for cuisine, food_type, difficulty in [
+            (Recipe.CuisineType.CHINESE, Recipe.FoodType.VEGAN, Recipe.DifficultyLevel.EASY),
+            (Recipe.CuisineType.CHINESE, Recipe.FoodType.VEGETARIAN, Recipe.DifficultyLevel.EASY),
+            (Recipe.CuisineType.SOUTH_INDIAN, Recipe.FoodType.VEGAN, Recipe.DifficultyLevel.HARD),
+        ]:
+            Recipe.objects.create(
+                author=cls.user,
+                title='Facet recipe',
+                servings=2,
+                prepration_time=timedelta(minutes=10),
+                total_time=timedelta(minutes=20),
+                calories=100,
+                instructions='Instructions.',
+                cuisine=cuisine,
+                food_type=food_type,
+                difficulty=difficulty
+            )
+
+    def counts(self, data):
+        facets = RecipeFilter(data=data, queryset=Recipe.objects.all()).facet_counts()
+        return {name: {option['label']: option['count'] for option in options} for name, options in facets.items()}
+
+    def test_counts_apply_the_other_active_filters(self):
+        counts = self.counts({'cuisine': Recipe.CuisineType.CHINESE})
+        self.assertEqual(counts['cuisine'], {'South Indian': 1, 'North Indian': 0, 'Chinese': 2})
+        self.assertEqual(counts['food_type'], {'Veg': 1, 'Non-Veg': 0, 'Vegan': 1})
+        self.assertEqual(counts['difficulty'], {'Easy': 2, 'Medium': 0, 'Hard': 0})
+
+    @override_settings(SHARED_CACHE=True)
+    def test_counts_cost_one_query_and_are_cached_until_a_recipe_changes(self):
+        with self.assertNumQueries(1):
+            self.counts({'food_type': Recipe.FoodType.VEGAN, 'search': 'facet'})
+        with self.assertNumQueries(0):
+            counts = self.counts({'search': ' Facet ', 'food_type': Recipe.FoodType.VEGAN})
+        self.assertEqual(counts['cuisine']['Chinese'], 1)
+
+        Recipe.objects.filter(cuisine=Recipe.CuisineType.SOUTH_INDIAN).get().save()
+        with self.assertNumQueries(1):
+            self.counts({'food_type': Recipe.FoodType.VEGAN, 'search': 'facet'})
+
+    @override_settings(SHARED_CACHE=False)
+    def test_counts_are_not_cached_without_a_shared_cache(self):
+        for _ in range(2):
+            with self.assertNumQueries(1):
+                self.counts({'food_type': Recipe.FoodType.VEGAN})
+
+
+@override_settings(SHARED_CACHE=True)  # One process, so its local-memory cache is shared by every request.
+class RecipeResultCacheTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='testuser', password='password')
+        cls.recipes = [
+            Recipe.objects.create(
+                author=cls.user,
+                title=f'Cached recipe {i}',
+                servings=2,
+                prepration_time=timedelta(minutes=10),
+                total_time=timedelta(minutes=20),
+                calories=calories,
+                instructions='Instructions.',
+                cuisine=Recipe.CuisineType.CHINESE,
+                food_type=Recipe.FoodType.VEGAN,
+                difficulty=Recipe.DifficultyLevel.EASY
+            )
+            for i, calories in enumerate([300, 100, 200])
+        ]
+
+    def setUp(self):
+        # Nothing is written between these tests, so earlier results would still be current.
+        cache.clear()
+
+    def ids(self, data):
+        return RecipeFilter(data=data, queryset=Recipe.objects.for_listing().order_by('-created_at')).cached_ids(featured=False)
+
+    def test_ids_follow_the_requested_order_and_are_cached(self):
+        with self.assertNumQueries(1):
+            ids = self.ids({'sort_by_calories': 'calories'})
+        self.assertEqual(ids, [self.recipes[1].pk, self.recipes[2].pk, self.recipes[0].pk])
+        with self.assertNumQueries(0):
+            self.assertEqual(self.ids({'sort_by_calories': 'calories'}), ids)
+        self.assertEqual(self.ids({}), [r.pk for r in reversed(self.recipes)])
+
+    def test_ingredient_writes_invalidate_cached_ids(self):
+        self.assertEqual(self.ids({'search': 'saffron'}), [])
+        RecipeIngredient.objects.create(recipe=self.recipes[0], name='Saffron', quantity=1, unit=RecipeIngredient.UnitType.GRAMS)
+        self.assertEqual(self.ids({'search': 'saffron'}), [self.recipes[0].pk])
+
+    @override_settings(PAGE_CACHE_TIMEOUT=0)
+    def test_invalid_filters_do_not_poison_the_cache(self):
+        vegetarian = str(Recipe.FoodType.VEGETARIAN)
+        self.assertEqual(self.ids({'cuisine': '99', 'food_type': vegetarian}), [])
+        self.assertEqual(self.ids({}), [r.pk for r in reversed(self.recipes)])
+
+        RecipeFilter({'cuisine': '99', 'food_type': vegetarian}, queryset=Recipe.objects.all()).facet_counts()
+        facets = RecipeFilter({}, queryset=Recipe.objects.all()).facet_counts()
+        chinese = next(option for option in facets['cuisine'] if option['value'] == str(Recipe.CuisineType.CHINESE))
+        self.assertEqual(chinese['count'], 3)
+
+        self.client.get(reverse('recipe_list'), {'cuisine': '99', 'food_type': vegetarian})
+        response = self.client.get(reverse('recipe_list'))
+        self.assertEqual(len(response.context['recipes_page_obj'].paginator.object_list), 3)
+
+    def test_user_filter_without_a_user_has_its_own_key(self):
+        self.assertEqual(self.ids({'user_filter': 'true'}), [])
+        self.assertEqual(self.ids({}), [r.pk for r in reversed(self.recipes)])
+
+        chinese = str(Recipe.CuisineType.CHINESE)
+        for data, expected in (({'user_filter': 'true'}, 0), ({}, 3)):
+            facets = RecipeFilter(data, queryset=Recipe.objects.all()).facet_counts()
+            self.assertEqual(next(o['count'] for o in facets['cuisine'] if o['value'] == chinese), expected, data)
+
+    @override_settings(SHARED_CACHE=False)
+    def test_nothing_is_cached_without_a_shared_cache(self):
+        # Another worker's writes could not bump this process's version.
+        self.assertIsNone(self.ids({}))
+        self.assertIsNone(cache.get(CATALOGUE_VERSION_KEY))
+
+    @override_settings(RECIPE_RESULT_CACHE_MAX_IDS=2)
+    def test_large_results_are_paged_from_the_queryset(self):
+        self.assertIsNone(self.ids({}))
+        response = self.client.get(reverse('recipe_list'))
+        self.assertEqual([r.pk for r in response.context['recipes_page_obj']], [r.pk for r in reversed(self.recipes)])
+
+
 class RecipeCollectionFilterTests(TestCase):
     @classmethod
     def setUpTestData(cls):
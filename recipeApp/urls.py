@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 
 
 urlpatterns = [
@@ -9,9 +9,19 @@ urlpatterns = [
     path('recipes/create/', views.RecipeCreateView.as_view(), name='recipe-create'),
     path('recipes/<int:pk>/edit/',views.RecipeUpdateView.as_view(), name='recipe_edit'),
     path('recipes/<int:pk>/delete/', views.RecipeDeleteView.as_view(), name='recipe_delete'),
+    path('recipes/export/', views.export_recipes, name='recipe_export'),
+    path('recipes/picker/', views.recipe_picker, name='recipe_picker'),
+    path('media/r/<int:width>x<int:height>/<path:name>', views.resized_image, name='resized_image'),
+    path('ingredients/autocomplete/', views.ingredient_autocomplete, name='ingredient_autocomplete'),
     path('collections/', views.RecipeCollectionListView.as_view(), name='collection_list'),
+    path('collections/export/', views.export_collections, name='collection_export'),
     path('collections/<int:pk>/', views.RecipeCollectionDetailView.as_view(), name='collection_detail'),
+    path('collections/<int:pk>/download/', views.download_collection, name='collection_download'),
     path('collections/create/', views.RecipeCollectionCreateView.as_view(), name='collection_create'),
     path('collections/<int:pk>/edit/',views.RecipeCollectionUpdate.as_view(), name='collection_edit'),
     path('collections/<int:pk>/delete/', views.RecipeCollectionDeleteView.as_view(), name='collection_delete'),
+    path('api/recipes/', api.recipe_list, name='api_recipe_list'),
+    path('api/recipes/<int:pk>/', api.recipe_detail, name='api_recipe_detail'),
+    path('api/collections/', api.collection_list, name='api_collection_list'),
+    path('api/collections/<int:pk>/', api.collection_detail, name='api_collection_detail'),
 ]
\ No newline at end of file
@@ -0,0 +1,45 @@
+"""
+Resizing for ``RecipeImage`` variants. Only Pillow and the standard library are
+imported here, so a fresh worker process can load this module without setting
+up Django; it is handed file paths and returns dimensions.
+"""
+import os
+
+from PIL import Image, ImageOps
+
+
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def render_variants(source_path, targets):
+    """
+    Render every target of one source image. ``targets`` is a list of
+    ``(name, width, height, crop, {format: output_path})``; cropped targets fill
+    the box exactly, others fit inside it. Returns ``{name: (width, height)}``.
+    """
+    with Image.open(source_path) as source:
+        source = ImageOps.exif_transpose(source)
+        if source.mode != 'RGB':
+            background = Image.new('RGB', source.size, 'white')
+            background.paste(source, mask=source.getchannel('A') if 'A' in source.getbands() else None)
+            source = background
+
+        sizes = {}
+        for name, width, height, crop, outputs in targets:
+            if crop:
+                variant = ImageOps.fit(source, (width, height), Image.Resampling.LANCZOS)
+            else:
+                variant = source.copy()
+                variant.thumbnail((width, height), Image.Resampling.LANCZOS)
+            for fmt, path in outputs.items():
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                pil_format, options = FORMATS[fmt]
+                # Write beside the target and rename, so readers never see half a file.
+                partial = f'{path}.part'
+                variant.save(partial, pil_format, **options)
+                os.replace(partial, path)
+            sizes[name] = variant.size
+        return sizes
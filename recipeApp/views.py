@@ -1,54 +1,243 @@
-from django.shortcuts import render, redirect
+from django.conf import settings
+from django.core.exceptions import PermissionDenied, SuspiciousFileOperation
+from django.core.files.storage import default_storage
+from django.http import Http404, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render, redirect
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.utils.module_loading import import_string
+from django.views.decorators.http import require_GET, require_safe
 from django.contrib.auth.models import User
 from django.views.generic import TemplateView, ListView, DetailView, FormView, UpdateView, DeleteView
-from .models import Recipe, RecipeCollection
+from .models import Recipe, RecipeCollection, RecipeImage
 from django.core.paginator import Paginator
 from .forms import RecipeForm, RecipeImageFormSet, RecipeIngredientFormSet, RecipeCollectionForm
 import json
 from django.urls import reverse_lazy
 from .filters import RecipeFilter, RecipeCollectionFilter
 from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.decorators import login_required
 from django.utils.decorators import method_decorator
-from .decorators import recipe_owner_required,collection_owner_required
+from .decorators import anonymous_page_cache, recipe_owner_required,collection_owner_required
+from .pagination import KeysetPaginator
+from .autocomplete import get_ingredient_index
+from .search import get_search_backend
+from .writes import save_recipe
+from .conditional import collection_state, conditional_detail, recipe_state
+from .resize import allowed_size, get_resize_cache
+from .sendfile import send_file
+from .archives import archive_name, collection_archive
+from .exports import COLLECTION_COLUMNS, ENCODERS, RECIPE_COLUMNS, collection_rows, export_response, recipe_rows
 
 
+RECIPE_PICKER_PAGE_SIZE = 20
+RESIZED_IMAGE_MAX_AGE = 365 * 24 * 60 * 60
+MEDIA_MAX_AGE = 24 * 60 * 60
+
+
+class OwnedObjectMixin:
+    """Reuse the object an owner decorator already fetched instead of loading it again."""
+
+    def get_object(self, queryset=None):
+        owned = getattr(self.request, 'owned_object', None)
+        if owned is not None and queryset is None:
+            return owned
+        return super().get_object(queryset)
+
+
+class CursorPaginationMixin:
+    cursor_params = ('cursor',)
+
+    def use_cursor_pagination(self, queryset):
+        requested = settings.CURSOR_PAGINATION or any(self.request.GET.get(param) for param in self.cursor_params)
+        return requested and KeysetPaginator.supports(queryset)
+
+    def get_cursor_page(self, queryset, per_page, param='cursor'):
+        return KeysetPaginator(queryset, per_page).get_page(self.request.GET.get(param))
+
+
+@require_GET
+def ingredient_autocomplete(request):
+    try:
+        limit = int(request.GET.get('limit', 10))
+    except ValueError:
+        limit = 10
+    suggestions = get_ingredient_index().suggest(request.GET.get('q', ''), limit)
+    return JsonResponse({'results': [{'name': name, 'uses': uses} for name, uses in suggestions]})
+
+
+@login_required
+@require_GET
+def recipe_picker(request):
+    queryset = Recipe.objects.select_related('author').only('pk', 'title', 'created_at', 'author__username')
+    query = request.GET.get('q', '').strip()
+    if query:
+        queryset = queryset.filter(get_search_backend().match(query))
+    page = KeysetPaginator(queryset.order_by('-created_at'), RECIPE_PICKER_PAGE_SIZE).get_page(request.GET.get('cursor'))
+    return JsonResponse({
+        'results': [{'id': recipe.pk, 'title': recipe.title, 'author': recipe.author.username} for recipe in page],
+        'next': page.next_cursor,
+    })
+
+
+@login_required
+@require_GET
+def export_recipes(request):
+    """The recipes the list page would show for the same filters, streamed as ``?format=jsonl`` or ``csv``."""
+    fmt = request.GET.get('format', 'jsonl')
+    if fmt not in ENCODERS:
+        return HttpResponseBadRequest('Unknown export format.')
+    queryset = RecipeFilter(request.GET, queryset=Recipe.objects.order_by('-created_at'), user=request.user).qs
+    return export_response(recipe_rows(queryset), RECIPE_COLUMNS, fmt, 'recipes')
+
+
+@login_required
+@require_GET
+def export_collections(request):
+    fmt = request.GET.get('format', 'jsonl')
+    if fmt not in ENCODERS:
+        return HttpResponseBadRequest('Unknown export format.')
+    queryset = RecipeCollectionFilter(request.GET, queryset=RecipeCollection.objects.order_by('-created_at'), user=request.user).qs
+    return export_response(collection_rows(queryset), COLLECTION_COLUMNS, fmt, 'collections')
+
+
+@login_required
+@require_GET
+def download_collection(request, pk):
+    """The collection's recipes and their images as a ZIP, written while it downloads."""
+    collection = get_object_or_404(RecipeCollection.objects.only('pk', 'title'), pk=pk)
+    response = StreamingHttpResponse(collection_archive(collection), content_type='application/zip')
+    response['Content-Disposition'] = f'attachment; filename="{archive_name(collection)}"'
+    return response
+
+
+def can_view_media(request, image):
+    """The default ``MEDIA_ACCESS_CHECK``: recipe images appear on the public list, so anyone may see them."""
+    return True
+
+
+def media_image(name):
+    """The ``RecipeImage`` a media file belongs to, as its upload or one of its rendered variants, or None."""
+    images = RecipeImage.objects.only('pk', 'recipe_id', 'image')
+    if name.startswith('variants/'):
+        # variants/<source name without extension>/<variant>.<ext>
+        stem = name.rpartition('/')[0][len('variants/'):]
+        return images.filter(image__startswith=f'{stem}.').first() if stem else None
+    return images.filter(image=name).first()
+
+
+@require_safe
+def serve_media(request, name):
+    """
+    Files under ``MEDIA_ROOT`` that belong to a ``RecipeImage`` the request may
+    see, as decided by the ``MEDIA_ACCESS_CHECK`` callable, and copied out by
+    the front server when ``MEDIA_SENDFILE`` is set. Files still being written
+    and files no image owns are not served.
+    """
+    if name.endswith('.part') or any(part.startswith('.') for part in name.split('/')):
+        raise Http404
+    image = media_image(name)
+    if image is None:
+        raise Http404
+    check_path = getattr(settings, 'MEDIA_ACCESS_CHECK', 'recipeApp.views.can_view_media')
+    if not import_string(check_path)(request, image):
+        raise PermissionDenied
+    try:
+        file = open(default_storage.path(name), 'rb')
+    except (SuspiciousFileOperation, FileNotFoundError, IsADirectoryError, NotADirectoryError):
+        raise Http404
+    response = send_file(request, file)
+    if check_path == 'recipeApp.views.can_view_media':
+        patch_cache_control(response, public=True, max_age=MEDIA_MAX_AGE)
+    else:
+        # Another check may answer differently per visitor, so shared caches must not keep the file.
+        patch_vary_headers(response, ['Cookie'])
+        patch_cache_control(response, private=True, max_age=MEDIA_MAX_AGE)
+    return response
+
+
+@require_safe
+def resized_image(request, width, height, name):
+    """
+    A recipe image scaled to fit ``width`` x ``height``, for sizes listed in
+    ``IMAGE_RESIZE_SIZES``. Stored names never change content, so browsers and
+    proxies may keep the response for good.
+    """
+    if not allowed_size(width, height):
+        raise Http404
+    image = RecipeImage.objects.filter(image=name).only('image').first()
+    if image is None:
+        raise Http404
+    try:
+        resized = get_resize_cache().open(image.image.path, name, width, height)
+    except OSError:
+        raise Http404
+    response = send_file(request, resized, content_type='image/jpeg')
+    patch_cache_control(response, public=True, max_age=RESIZED_IMAGE_MAX_AGE, immutable=True)
+    return response
+
+
+@method_decorator(anonymous_page_cache, name='dispatch')
 class HomePageView(TemplateView):
     template_name = 'home.html'
     
 
-class RecipeListView(ListView):
+@method_decorator(anonymous_page_cache, name='dispatch')
+class RecipeListView(CursorPaginationMixin, ListView):
     model = Recipe
     template_name = 'recipes/list.html'
     context_object_name = 'recipes'
     paginate_by = 3
     filterset_class = RecipeFilter
+    cursor_params = ('cursor', 'featured_cursor')
 
     def get_queryset(self):
-        queryset = Recipe.objects.filter().order_by('-created_at')
+        queryset = Recipe.objects.for_listing().order_by('-created_at')
         self.filterset = RecipeFilter(self.request.GET, queryset=queryset,user=self.request.user)
         return self.filterset.qs
 
+    def get_paginate_by(self, queryset):
+        # Both rails are paged in get_context_data, from cached ids where possible;
+        # paging the combined queryset here would only cost a COUNT(*) nobody reads.
+        return None
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         
         filtered_queryset = self.filterset.qs
         context['filter'] = self.filterset
+        context['facets'] = self.filterset.facet_counts()
         
         featured_recipes = filtered_queryset.filter(featured=True)
-        featured_paginator = Paginator(featured_recipes, 3)  
+        normal_recipes = filtered_queryset.filter(featured=False)
+
+        if self.use_cursor_pagination(filtered_queryset):
+            context['cursor_pagination'] = True
+            context['featured_recipes_page_obj'] = self.get_cursor_page(featured_recipes, 3, 'featured_cursor')
+            context['recipes_page_obj'] = self.get_cursor_page(normal_recipes, self.paginate_by, 'cursor')
+            return context
+
+        featured_ids = self.filterset.cached_ids(featured=True)
+        featured_paginator = Paginator(featured_recipes if featured_ids is None else featured_ids, 3)  
         featured_page_number = self.request.GET.get('featured_page')
         
-        normal_recipes = filtered_queryset.filter(featured=False)
-        normal_paginator = Paginator(normal_recipes, self.paginate_by)
+        normal_ids = self.filterset.cached_ids(featured=False)
+        normal_paginator = Paginator(normal_recipes if normal_ids is None else normal_ids, self.paginate_by)
         page_number = self.request.GET.get('page')
         
-        context['featured_recipes_page_obj'] = featured_paginator.get_page(featured_page_number)
-        context['recipes_page_obj'] = normal_paginator.get_page(page_number)
+        context['featured_recipes_page_obj'] = self.load_page(featured_paginator.get_page(featured_page_number), featured_ids)
+        context['recipes_page_obj'] = self.load_page(normal_paginator.get_page(page_number), normal_ids)
 
         return context
 
+    def load_page(self, page, ids):
+        """Swap a page of cached ids for the recipes themselves, fetched in one batch."""
+        if ids is not None:
+            recipes = Recipe.objects.for_listing().in_bulk(page.object_list)
+            page.object_list = [recipes[pk] for pk in page.object_list if pk in recipes]
+        return page
 
-class RecipeCollectionListView(ListView):
+
+class RecipeCollectionListView(CursorPaginationMixin, ListView):
     model = RecipeCollection
     template_name = 'collections/list.html'  
     context_object_name = 'collections'
@@ -56,28 +245,45 @@ class RecipeCollectionListView(ListView):
     filterset_class = RecipeCollectionFilter
 
     def get_queryset(self):
-        queryset = RecipeCollection.objects.all().order_by('-created_at')
+        queryset = RecipeCollection.objects.select_related('user').order_by('-created_at')
         self.filterset = RecipeCollectionFilter(self.request.GET, queryset=queryset,user=self.request.user)
         return self.filterset.qs
 
+    def paginate_queryset(self, queryset, page_size):
+        if self.use_cursor_pagination(queryset):
+            page = self.get_cursor_page(queryset, page_size)
+            return (None, page, page.object_list, page.has_other_pages())
+        return super().paginate_queryset(queryset, page_size)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         filtered_queryset = self.filterset.qs
         context['filter'] = self.filterset
-        context['collection_count'] = filtered_queryset.count()  
+        context['cursor_pagination'] = self.use_cursor_pagination(filtered_queryset)
+        paginator = context['paginator']
+        # Cursor pages never count; the heading goes without a total then.
+        context['collection_count'] = None if paginator is None else paginator.count
         return context
 
 
+@method_decorator(conditional_detail(recipe_state), name='get')
 class RecipeDetailView(LoginRequiredMixin,DetailView):
     model = Recipe
     template_name = 'recipes/detail.html'
     context_object_name = 'recipe'
 
+    def get_queryset(self):
+        return Recipe.objects.for_detail()
+
 
+@method_decorator(conditional_detail(collection_state), name='get')
 class RecipeCollectionDetailView(LoginRequiredMixin,DetailView):
     model = RecipeCollection
     template_name = 'collections/detail.html'
     context_object_name = 'collection'
+
+    def get_queryset(self):
+        return RecipeCollection.objects.for_detail()
  
  
 class RecipeCollectionCreateView(LoginRequiredMixin,FormView):
@@ -96,14 +302,11 @@ class RecipeCollectionCreateView(LoginRequiredMixin,FormView):
         return super().form_invalid(form)
     
 @method_decorator(collection_owner_required, name='dispatch')
-class RecipeCollectionUpdate(UpdateView):
+class RecipeCollectionUpdate(OwnedObjectMixin, UpdateView):
     model = RecipeCollection  
     form_class = RecipeCollectionForm
     template_name = 'collections/collection_form.html'  
 
-    def get_object(self, queryset=None):
-        return super().get_object(queryset)
-
     def form_valid(self, form):
         collection = form.save(commit=False)
         collection.user = self.request.user  
@@ -115,51 +318,52 @@ class RecipeCollectionUpdate(UpdateView):
         return super().form_invalid(form)
 
 
-class RecipeCreateView(LoginRequiredMixin,FormView):
+class RecipeFormsetsMixin:
+    """Build the ingredient and image formsets once per request and save everything through ``save_recipe``."""
+
+    def get_formsets(self):
+        if not hasattr(self, '_formsets'):
+            kwargs = {'instance': self.object} if getattr(self, 'object', None) else {}
+            if self.request.method == 'POST':
+                self._formsets = (
+                    RecipeIngredientFormSet(self.request.POST, prefix='ingredients', **kwargs),
+                    RecipeImageFormSet(self.request.POST, self.request.FILES, prefix='images', **kwargs),
+                )
+            else:
+                self._formsets = (
+                    RecipeIngredientFormSet(prefix='ingredients', **kwargs),
+                    RecipeImageFormSet(prefix='images', **kwargs),
+                )
+        return self._formsets
+
+    def form_valid(self, form):
+        ingredient_formset, image_formset = self.get_formsets()
+        # A formset the page did not submit at all (no management form) is left untouched.
+        submitted = [formset for formset in (ingredient_formset, image_formset) if formset.management_form.is_valid()]
+        if not all(formset.is_valid() for formset in submitted):
+            return self.form_invalid(form)
+
+        recipe = save_recipe(
+            form,
+            ingredient_formset if ingredient_formset in submitted else None,
+            image_formset if image_formset in submitted else None,
+            author=self.request.user,
+        )
+        return redirect('recipe_detail', pk=recipe.pk)
+
+
+class RecipeCreateView(LoginRequiredMixin, RecipeFormsetsMixin, FormView):
     model = Recipe
     form_class = RecipeForm
     template_name = 'recipes/recipe_form.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        if self.request.POST:
-            context['ingredient_formset'] = RecipeIngredientFormSet(self.request.POST, prefix='ingredients')
-            context['image_formset'] = RecipeImageFormSet(self.request.POST, self.request.FILES, prefix='images')
-        else:
-            context['ingredient_formset'] = RecipeIngredientFormSet(prefix='ingredients')
-            context['image_formset'] = RecipeImageFormSet(prefix='images')
+        context['ingredient_formset'], context['image_formset'] = self.get_formsets()
         return context
 
-    def form_valid(self, form):
-        recipe = form.save(commit=False)
-        recipe.author = self.request.user
-        recipe.save()
-
-        ingredient_formset = RecipeIngredientFormSet(self.request.POST, prefix='ingredients')
-
-        if ingredient_formset.is_valid():
-            ingredients = ingredient_formset.save(commit=False)
-            for ingredient in ingredients:
-                ingredient.recipe = recipe 
-                ingredient.save()
-        else:
-            print(ingredient_formset.errors)  
-
-        image_formset = RecipeImageFormSet(self.request.POST, self.request.FILES, prefix='images')
-        
-        if image_formset.is_valid():
-            images = image_formset.save(commit=False)
-            for image in images:
-                image.recipe = recipe  
-                image.save()
-        else:
-            print(image_formset.errors)  
-
-        return redirect('recipe_detail', pk=recipe.pk)
-    
     def form_invalid(self, form):
-        ingredient_formset = RecipeIngredientFormSet(self.request.POST, prefix='ingredients')
-        image_formset = RecipeImageFormSet(self.request.POST, self.request.FILES, prefix='images')
+        ingredient_formset, image_formset = self.get_formsets()
         
         initial_ingredients = [
             {
@@ -181,9 +385,6 @@ class RecipeCreateView(LoginRequiredMixin,FormView):
 
             for image in image_formset.forms if image.is_valid() and not image.cleaned_data.get('DELETE', False)
         ]
-        
-        ingredient_formset = RecipeIngredientFormSet(self.request.POST, initial=initial_ingredients, prefix='ingredients')
-        image_formset = RecipeImageFormSet(self.request.POST,self.request.FILES, initial=initial_images, prefix='images')
 
         return self.render_to_response({
             'form': form,
@@ -195,7 +396,7 @@ class RecipeCreateView(LoginRequiredMixin,FormView):
             
             
 @method_decorator(recipe_owner_required, name='dispatch')           
-class RecipeUpdateView(UpdateView):
+class RecipeUpdateView(OwnedObjectMixin, RecipeFormsetsMixin, UpdateView):
     model = Recipe
     form_class = RecipeForm
     template_name = 'recipes/recipe_form.html'
@@ -203,12 +404,7 @@ class RecipeUpdateView(UpdateView):
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         recipe = self.object
-        context['ingredient_formset'] = RecipeIngredientFormSet(
-            instance=recipe, prefix='ingredients'
-        )
-        context['image_formset'] = RecipeImageFormSet(
-            instance=recipe, prefix='images'
-        )
+        context['ingredient_formset'], context['image_formset'] = self.get_formsets()
         context['initial_ingredients'] = json.dumps([
             {
                 'id': ingredient.id,
@@ -228,28 +424,8 @@ class RecipeUpdateView(UpdateView):
         context['recipe'] = recipe
         return context
 
-    def form_valid(self, form):
-        recipe = form.save(commit=False)
-        recipe.author = self.request.user  
-        recipe.save()
-
-        ingredient_formset = RecipeIngredientFormSet(self.request.POST, instance=recipe, prefix='ingredients')
-        if ingredient_formset.is_valid():
-            ingredient_formset.save() 
-        else:
-            print(ingredient_formset.errors)
-
-        image_formset = RecipeImageFormSet(self.request.POST, self.request.FILES, instance=recipe, prefix='images')
-        if image_formset.is_valid():
-            image_formset.save()  
-        else:
-            print(image_formset.errors,"image")
-            
-        return redirect('recipe_detail', pk=recipe.pk)
-
     def form_invalid(self, form):
-        ingredient_formset = RecipeIngredientFormSet(self.request.POST, instance=self.object, prefix='ingredients')
-        image_formset = RecipeImageFormSet(self.request.POST, self.request.FILES, instance=self.object, prefix='images')
+        ingredient_formset, image_formset = self.get_formsets()
         initial_ingredients = json.dumps([
             {
                 'id': ingredient.id,
@@ -278,22 +454,16 @@ class RecipeUpdateView(UpdateView):
 
 
 @method_decorator(recipe_owner_required, name='dispatch')           
-class RecipeDeleteView(DeleteView):
+class RecipeDeleteView(OwnedObjectMixin, DeleteView):
     model = Recipe
     template_name = 'recipes/recipe_confirm_delete.html'  
     context_object_name = 'recipe'
     success_url = reverse_lazy('recipe_list')  
 
-    def get_queryset(self):
-        return super().get_queryset()
-
 
 @method_decorator(collection_owner_required, name='dispatch')
-class RecipeCollectionDeleteView(DeleteView):
+class RecipeCollectionDeleteView(OwnedObjectMixin, DeleteView):
     model = RecipeCollection
     template_name = 'collections/collection_confirm_delete.html' 
     context_object_name = 'collection'
-    success_url = reverse_lazy('collection_list')  
-
-    def get_queryset(self):
-        return super().get_queryset()
\ No newline at end of file
+    success_url = reverse_lazy('collection_list')
\ No newline at end of file
@@ -0,0 +1,118 @@
+from collections import Counter
+
+from django.db import transaction
+
+from .autocomplete import loaded_ingredient_index
+from .cache import bump_catalogue_version, bump_page_version
+from .images import refresh_variants
+from .models import ImageBlob, Recipe, RecipeImage, RecipeIngredient
+from .search import get_search_backend
+from .signals import recipe_contents_saved
+
+
+def save_recipe(form, ingredient_formset, image_formset, author=None):
+    """
+    Save a validated recipe form with its ingredient and image formsets in one
+    transaction: the recipe row, then per formset one ``bulk_create`` for new
+    rows, one ``bulk_update`` for changed rows and one ``delete`` for removed
+    rows. A formset may be ``None`` to leave those rows alone. ``bulk_*``
+    sends no model signals, so ``recipe_contents_saved`` is sent once at the
+    end for the counters, search and caches.
+    """
+    with transaction.atomic():
+        recipe = form.save(commit=False)
+        if author is not None:
+            recipe.author = author
+        recipe.save()
+
+        ingredients = save_formset(ingredient_formset, recipe)
+        images = save_formset(image_formset, recipe)
+        renamed = [i for i in ingredients['updated'] if i._loaded_name != i.name]
+
+        recipe_contents_saved.send(
+            sender=recipe.__class__,
+            recipe=recipe,
+            added_names=[i.name for i in ingredients['created']] + [i.name for i in renamed],
+            removed_names=[i._loaded_name for i in renamed],
+            images=images['created'] + images['updated'],
+        )
+    return recipe
+
+
+def save_formset(formset, recipe):
+    """Write a validated inline formset's rows for ``recipe`` in bulk; returns them by outcome."""
+    rows = {'created': [], 'updated': [], 'deleted': []}
+    if formset is None:
+        return rows
+    model = formset.model
+    fields = [name for name in formset.form._meta.fields if name in formset.form.base_fields]
+
+    for form in formset.forms:
+        obj = form.instance
+        if formset.can_delete and formset._should_delete_form(form):
+            if obj.pk is not None:
+                rows['deleted'].append(obj)
+        elif obj.pk is None:
+            if form.has_changed():
+                obj.recipe = recipe
+                rows['created'].append(obj)
+        elif form.has_changed():
+            rows['updated'].append(obj)
+
+    if rows['deleted']:
+        # A plain queryset delete still sends post_delete per row, which keeps
+        # counters and suggestions right for the rows that go.
+        model.objects.filter(pk__in=[obj.pk for obj in rows['deleted']]).delete()
+    if rows['created']:
+        model.objects.bulk_create(rows['created'])
+    if rows['updated']:
+        for obj in rows['updated']:
+            for name in fields:
+                # bulk_update skips pre_save, which is what commits uploaded files.
+                field = model._meta.get_field(name)
+                setattr(obj, field.attname, field.pre_save(obj, add=False))
+        model.objects.bulk_update(rows['updated'], fields)
+    return rows
+
+
+def create_recipes(entries):
+    """
+    Insert new recipes in one transaction. ``entries`` is a list of
+    ``(recipe, ingredients, images)`` with unsaved instances; each table gets a
+    single ``bulk_create``. Counters, the search index, image references and
+    caches are brought up to date once for the whole batch instead of through
+    per-row signals. Returns the saved recipes.
+    """
+    recipes = [recipe for recipe, _, _ in entries]
+    for recipe, ingredients, _ in entries:
+        recipe.num_ingredients = len(ingredients)
+
+    with transaction.atomic():
+        Recipe.objects.bulk_create(recipes)
+        ingredients, images = [], []
+        for recipe, recipe_ingredients, recipe_images in entries:
+            for row in recipe_ingredients:
+                row.recipe = recipe
+            for row in recipe_images:
+                row.recipe = recipe
+            ingredients.extend(recipe_ingredients)
+            images.extend(recipe_images)
+        RecipeIngredient.objects.bulk_create(ingredients)
+        RecipeImage.objects.bulk_create(images)
+
+        get_search_backend().index_recipes([recipe.pk for recipe in recipes])
+        ImageBlob.objects.retain(image.image.name for image in images)
+        refresh_variants(images)
+
+        names = Counter(ingredient.name for ingredient in ingredients)
+
+        def update_suggestions():
+            index = loaded_ingredient_index()
+            if index is not None:
+                for name, count in names.items():
+                    index.add(name, count)
+
+        transaction.on_commit(update_suggestions)
+        transaction.on_commit(bump_catalogue_version)
+        transaction.on_commit(bump_page_version)
+    return recipes